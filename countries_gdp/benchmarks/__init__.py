@@ -0,0 +1,3 @@
+"""Offline benchmarks. Run them from the project dir (the one with scrapy.cfg), i.e.:
+    python -m benchmarks.bench_extraction
+"""
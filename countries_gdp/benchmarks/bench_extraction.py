@@ -0,0 +1,41 @@
+"""ItemLoader loop vs compiled extraction (extractors.py) in GdpSpider.parse
+
+    python -m benchmarks.bench_extraction [--rows 213 2000 20000] [--repeat 5]
+
+Both modes must produce the same items, the benchmark checks it before timing anything.
+"""
+import argparse
+
+from countries_gdp.spiders.gdp import GdpSpider
+
+from .common import best_of, fixture_response
+
+
+def parse_all(response, mode):
+    # a new response each time would re-parse the html, we want the extraction cost only (the DOM is cached)
+    return [dict(item) for item in GdpSpider(extraction_mode=mode).parse(response)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[None, 2_000, 20_000],
+                        help="table sizes (default: the fixture as is, 2000, 20000)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'loader ms':>10} {'compiled ms':>12} {'speedup':>8}")
+    for rows in args.rows:
+        response = fixture_response(rows)
+        response.selector  # build the DOM once, outside of the timings
+
+        loader_items = parse_all(response, "loader")
+        if parse_all(response, "compiled") != loader_items:
+            raise SystemExit(f"compiled extraction differs from the ItemLoader one ({rows} rows)")
+
+        loader = best_of(lambda: parse_all(response, "loader"), args.repeat)
+        compiled = best_of(lambda: parse_all(response, "compiled"), args.repeat)
+        print(f"{len(loader_items):>8} {loader * 1000:>10.1f} {compiled * 1000:>12.1f} {loader / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Per-cell cost of the items.py input processors, before (remove_tags, str.strip, remove_commas, try_float, ...)
+and after (strip_tags, parse_gdp, parse_year: precompiled regexes, one pass, fast path for missing values)
+
+    python -m benchmarks.bench_processors [--rows 20000] [--repeat 5]
+
+The cells are the real ones of the fixture page (html as the ItemLoader gets them), the table is scaled to --rows.
+"""
+import argparse
+import re
+
+from itemloaders.processors import MapCompose
+from w3lib.html import remove_tags
+
+from countries_gdp.extractors import extract_rows
+from countries_gdp.items import parse_gdp, parse_year, strip_tags
+
+from .common import best_of, fixture_response
+
+
+# the processors as they were before items.py got precompiled, kept here as the baseline
+def remove_commas(value):
+    return value.replace(",", "")
+
+
+def try_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def try_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def extract_year(value):
+    year = re.findall(r"\d{4}", value)
+    if not year:
+        return value
+    return year
+
+
+BEFORE = {
+    "country_name": MapCompose(remove_tags, str.strip),
+    "region": MapCompose(remove_tags, str.strip),
+    "gdp": MapCompose(remove_tags, str.strip, remove_commas, try_float),
+    "year": MapCompose(remove_tags, str.strip, extract_year, try_int),
+}
+AFTER = {
+    "country_name": MapCompose(strip_tags),
+    "region": MapCompose(strip_tags),
+    "gdp": MapCompose(parse_gdp),
+    "year": MapCompose(parse_year),
+}
+
+
+def run_column(processor, column):
+    for values in column:
+        processor(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # {field: one list of cells per row}, the gdp/year columns of the 3 sources put together
+    columns = {}
+    for key, column in extract_rows(fixture_response(args.rows).selector.root).items():
+        field = key[1] if isinstance(key, tuple) else key
+        if field in BEFORE:
+            columns.setdefault(field, []).extend(column)
+
+    print(f"{'field':>14} {'cells':>7} {'before ns/cell':>15} {'after ns/cell':>14} {'speedup':>8}")
+    for field, column in columns.items():
+        cells = sum(len(values) for values in column)
+        before = best_of(lambda: run_column(BEFORE[field], column), args.repeat)
+        after = best_of(lambda: run_column(AFTER[field], column), args.repeat)
+        print(f"{field:>14} {cells:>7} {before / cells * 1e9:>15.0f} {after / cells * 1e9:>14.0f} "
+              f"{before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""scrapy.Item (CountriesGdpItem) vs slotted dataclass (CountriesGdpRecord): memory and throughput of the extraction
+
+    python -m benchmarks.bench_records [--rows 2000 20000] [--source html wikitext] [--repeat 3]
+
+html: the compiled extraction (extractors.py) of the fixture page scaled to --rows rows, the DOM built beforehand
+wikitext: wikitext.py on the wikitext of that page (what the gdp_revisions backfill parses)
+
+Every scenario runs in its own process. The items are kept in a list, like a revision's items in the backfill:
+    items/s: best of --repeat runs
+    python MB: peak of the python allocations (tracemalloc) while extracting and keeping the items
+    bytes/item: what the kept items take, per item (the items, their dicts, their values)
+Both item types must give the same values, checked before measuring.
+"""
+import argparse
+import multiprocessing
+import tracemalloc
+
+from itemadapter import ItemAdapter
+
+from countries_gdp.extractors import extract_countries
+from countries_gdp.items import CountriesGdpItem, CountriesGdpRecord
+from countries_gdp.wikitext import parse_countries
+
+from .common import FIXTURES_DIR, best_of, fixture_response
+
+ITEM_TYPES = {"item": CountriesGdpItem, "record": CountriesGdpRecord}
+
+
+def scaled_wikitext(rows):
+    # the data rows of the fixture's wikitext repeated until the table has `rows` rows
+    text = (FIXTURES_DIR / "gdp_nominal.wikitext").read_text(encoding="utf-8")
+    head, _, rest = text.partition("\n|-\n")
+    body, _, tail = rest.rpartition("\n|}")
+    data_rows = body.split("\n|-\n")
+    scaled = [data_rows[n % len(data_rows)] for n in range(rows)]
+    return head + "\n|-\n" + "\n|-\n".join(scaled) + "\n|}" + tail
+
+
+def source_loader(source, rows):
+    """-> function(item_cls) returning the list of all the items"""
+    if source == "html":
+        response = fixture_response(rows)
+        response.selector  # the DOM is built once, outside of the measures
+        return lambda item_cls: [item for _, items in extract_countries(response, item_cls) for item in items]
+    wikitext = scaled_wikitext(rows)
+    return lambda item_cls: [item for _, items in parse_countries(wikitext, item_cls) for item in items]
+
+
+def values(items):
+    return [{k: v for k, v in ItemAdapter(item).items() if v is not None} for item in items]
+
+
+def measure(source, rows, item_type, repeat):
+    load = source_loader(source, rows)
+    item_cls = ITEM_TYPES[item_type]
+    if values(load(item_cls)) != values(load(CountriesGdpItem)):
+        raise SystemExit(f"{item_type} values differ from the item ones ({source}, {rows} rows)")
+
+    elapsed = best_of(lambda: load(item_cls), repeat)
+
+    tracemalloc.start()
+    items = load(item_cls)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(items), elapsed, peak, kept / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2_000, 20_000])
+    parser.add_argument("--source", nargs="+", default=["html", "wikitext"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'source':>9} {'rows':>7} {'type':>7} {'items':>7} {'seconds':>8} {'items/s':>9} {'python MB':>10} "
+          f"{'bytes/item':>11}")
+    for source in args.source:
+        for rows in args.rows:
+            for item_type in ITEM_TYPES:
+                with context.Pool(1) as pool:  # a fresh process per scenario, nothing left over from the previous
+                    count, elapsed, peak, per_item = pool.apply(measure, (source, rows, item_type, args.repeat))
+                print(f"{source:>9} {rows:>7} {item_type:>7} {count:>7} {elapsed:>8.2f} {count / elapsed:>9.0f} "
+                      f"{peak / 2 ** 20:>10.1f} {per_item:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
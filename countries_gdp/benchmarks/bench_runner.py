@@ -0,0 +1,56 @@
+"""Sharded runner (countries_gdp/runner.py): pages/sec with 1, 2, 4... worker processes
+
+    python -m benchmarks.bench_runner [--pages 8] [--rows 5000] [--processes 1 2 4]
+
+No network: the pages are copies of the fixture (scaled to --rows rows) in a temporary directory, crawled through
+file:// urls, so the numbers are parsing + merging only. Speedup = pages/sec relative to the first --processes value,
+it can't go above the number of cores of the machine (os.cpu_count() is printed).
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from countries_gdp import runner
+
+from .common import scaled_page
+
+# quiet workers, no http cache shared between the runs
+OVERRIDES = {"LOG_LEVEL": "ERROR", "AUTOTHROTTLE_ENABLED": "False", "ROBOTSTXT_OBEY": "False",
+             "HTTPCACHE_ENABLED": "False"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=5_000, help="rows per page")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        html = scaled_page(args.rows)
+        urls = []
+        for n in range(args.pages):
+            path = Path(tmp) / f"gdp_{n}.html"
+            path.write_text(html, encoding="utf-8")
+            urls.append(path.as_uri())
+
+        print(f"cores: {os.cpu_count()}, {args.pages} pages x {args.rows} rows")
+        print(f"{'processes':>9} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+        baseline = None
+        for processes in args.processes:
+            db_path = Path(tmp) / f"runner_{processes}.db"
+            start = time.perf_counter()
+            summaries = runner.run(urls, processes, str(db_path), OVERRIDES)
+            elapsed = time.perf_counter() - start
+            if any(summary["stats"]["finish_reason"] != "finished" for summary in summaries):
+                raise SystemExit(f"some pages failed with {processes} processes: {summaries}")
+
+            rate = args.pages / elapsed
+            baseline = baseline or rate
+            print(f"{processes:>9} {elapsed:>8.2f} {rate:>8.2f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Memory of GdpSpider.parse: selector modes (whole DOM) vs streaming (streaming.py), for growing tables
+
+    python -m benchmarks.bench_streaming [--rows 1000 10000 40000] [--mode compiled streaming loader]
+
+Every scenario runs in its own process, from the response (already downloaded: the body is in memory whatever the
+mode, it's not counted) to the last item. The items are consumed one by one and not kept, like the pipelines do.
+    python MB: peak of the python allocations (tracemalloc), i.e. the decoded response.text of the selector modes
+    rss MB: how much the peak RSS of the process grew, it includes lxml's DOM (libxml2 mallocs, which tracemalloc
+        doesn't see)
+Expected: the selector modes grow with the table, streaming stays flat.
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+import tracemalloc
+
+from countries_gdp.spiders.gdp import GdpSpider
+
+from .common import fixture_response
+
+
+def measure(rows, mode):
+    response = fixture_response(rows)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on linux
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in GdpSpider(extraction_mode=mode).parse(response):
+        count += 1
+    elapsed = time.perf_counter() - start
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+    return count, elapsed, python_peak, rss_growth, len(response.body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 40_000])
+    parser.add_argument("--mode", nargs="+", default=["compiled", "streaming"],
+                        help="loader builds the same DOM as compiled, only much slower")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'rows':>8} {'html MB':>8} {'mode':>10} {'items':>8} {'seconds':>8} {'python MB':>10} {'rss MB':>8}")
+    for rows in args.rows:
+        for mode in args.mode:
+            with context.Pool(1) as pool:  # a fresh process: the peak RSS of a scenario doesn't leak into the next
+                count, elapsed, python_peak, rss_growth, size = pool.apply(measure, (rows, mode))
+            print(f"{rows:>8} {size / 2 ** 20:>8.1f} {mode:>10} {count:>8} {elapsed:>8.2f} "
+                  f"{python_peak / 2 ** 20:>10.1f} {rss_growth / 2 ** 20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Rendered html (selector / streaming modes) vs wikitext (wikitext.py) for the same table
+
+    python -m benchmarks.bench_wikitext [--repeat 5]
+
+Both fixtures hold the same page (fixtures/gdp_nominal.html and fixtures/gdp_nominal.wikitext): the items must be
+identical, the benchmark checks it first. The html timings include building the DOM (a new response every run),
+what a bulk backfill over many revisions would pay for every revision.
+"""
+import argparse
+
+from countries_gdp import wikitext
+from countries_gdp.spiders.gdp import GdpSpider
+
+from .common import FIXTURES_DIR, best_of, fixture_response
+
+WIKITEXT_PAGE = FIXTURES_DIR / "gdp_nominal.wikitext"
+
+
+def parse_html(mode):
+    return [dict(item) for item in GdpSpider(extraction_mode=mode).parse(fixture_response())]
+
+
+def parse_wikitext(text):
+    return [dict(item) for item in wikitext.parse_items(text)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = WIKITEXT_PAGE.read_text(encoding="utf-8")
+    if parse_wikitext(text) != parse_html("compiled"):
+        raise SystemExit("the wikitext items differ from the html ones")
+
+    html_size = len(fixture_response().body)
+    print(f"html: {html_size / 1024:.0f} KiB, wikitext: {len(text.encode('utf-8')) / 1024:.0f} KiB")
+    print(f"{'source':>20} {'ms':>8}")
+    timings = {f"html ({mode})": best_of(lambda: parse_html(mode), args.repeat)
+               for mode in ("loader", "compiled", "streaming")}
+    timings["wikitext"] = best_of(lambda: parse_wikitext(text), args.repeat)
+    for name, seconds in timings.items():
+        print(f"{name:>20} {seconds * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Helpers shared by the benchmarks: the stored copy of the GDP page, scaled to any number of rows"""
+import re
+import time
+from pathlib import Path
+
+from scrapy.http import HtmlResponse
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "fixtures"
+GDP_PAGE = FIXTURES_DIR / "gdp_nominal.html"
+GDP_URL = "https://en.wikipedia.org/wiki/List_of_countries_by_GDP_(nominal)"
+
+DATA_ROW = re.compile(r"<tr>\n.*?</tr>", re.S)  # the country rows, the header rows have a class
+COUNTRY_LINK = re.compile(r'(title="[^"]*">)([^<]*)(</a>)')
+
+
+def scaled_page(rows=None, path=GDP_PAGE):
+    """The fixture page with its country rows repeated until the table has `rows` rows (None or 0: original size).
+    The copies get a " #n" suffix on their names, so they aren't dropped as duplicate countries"""
+    html = path.read_text(encoding="utf-8")
+    if not rows:
+        return html
+
+    data_rows = DATA_ROW.findall(html)
+    scaled = []
+    for n in range(rows):
+        row = data_rows[n % len(data_rows)]
+        copy = n // len(data_rows)
+        if copy:
+            row = COUNTRY_LINK.sub(lambda m: f"{m[1]}{m[2]} #{copy}{m[3]}", row, count=1)
+        scaled.append(row)
+
+    first, last = html.index(data_rows[0]), html.rindex(data_rows[-1]) + len(data_rows[-1])
+    return html[:first] + "\n".join(scaled) + html[last:]
+
+
+def fixture_response(rows=None, path=GDP_PAGE):
+    return HtmlResponse(url=GDP_URL, body=scaled_page(rows, path).encode("utf-8"), encoding="utf-8")
+
+
+def best_of(func, repeat=5):
+    """Smallest wall time of `repeat` runs (the least disturbed one), in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
@@ -0,0 +1,169 @@
+"""Offline benchmark of the whole chain: GdpSpider.parse -> item processors -> the three pipelines
+
+    python -m benchmarks.run [--rows 0 10000 100000] [--mode loader compiled streaming] [--output results.json]
+    python -m benchmarks.run --compare before.json after.json
+
+No network: the page is the stored copy in fixtures/, scaled to the requested number of rows (0 = as is).
+Every scenario (rows x mode) runs in its own process, so the peak RSS of one doesn't leak into the next.
+
+Stages, timed per item:
+    parse: time to get the next item out of GdpSpider.parse (loader + processors), the DOM is built beforehand
+        (compiled mode processes whole columns before the first item comes out: that cost shows up in max_us,
+        streaming mode parses the body itself, the DOM built beforehand isn't used)
+    CountriesGdpPipeline / NoDuplicateCountryPipeline / SaveToDatabasePipeline: process_item
+        (SaveToDatabasePipeline's flushes land on the items that trigger them, close_spider's flush is timed apart)
+Results: items/sec over the whole chain, p50/p90/p99/max per stage (microseconds), peak RSS (MB).
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentiles(samples):
+    """p50/p90/p99/max in microseconds (nearest-rank)"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    summary = {f"p{p}_us": ordered[min(len(ordered) - 1, len(ordered) * p // 100)] * 1e6 for p in PERCENTILES}
+    summary["max_us"] = ordered[-1] * 1e6
+    summary["count"] = len(ordered)
+    return summary
+
+
+def run_scenario(rows, mode):
+    # imported here: the scenario runs in a fresh (spawned) process
+    from scrapy.exceptions import DropItem
+    from scrapy.utils.test import get_crawler
+
+    from countries_gdp.pipelines import CountriesGdpPipeline, NoDuplicateCountryPipeline, SaveToDatabasePipeline
+    from countries_gdp.spiders.gdp import GdpSpider
+
+    from .common import fixture_response
+
+    response = fixture_response(rows or None)
+    response.selector  # DOM built outside of the timings
+
+    with tempfile.TemporaryDirectory() as tmp:
+        crawler = get_crawler(settings_dict={"SQLITE_DB_PATH": str(Path(tmp) / "bench.db")})
+        spider = GdpSpider(extraction_mode=mode)
+        pipelines = [CountriesGdpPipeline(), NoDuplicateCountryPipeline(), SaveToDatabasePipeline.from_crawler(crawler)]
+        pipelines[-1].open_spider(spider)
+
+        samples = {"parse": []}
+        samples.update({type(p).__name__: [] for p in pipelines})
+        dropped = {}
+        items = 0
+
+        start = time.perf_counter()
+        parsed = iter(spider.parse(response))
+        while True:
+            t0 = time.perf_counter()
+            item = next(parsed, None)
+            if item is None:
+                break
+            samples["parse"].append(time.perf_counter() - t0)
+
+            for pipeline in pipelines:
+                name = type(pipeline).__name__
+                t0 = time.perf_counter()
+                try:
+                    item = pipeline.process_item(item, spider)
+                except DropItem:
+                    dropped[name] = dropped.get(name, 0) + 1
+                    item = None
+                samples[name].append(time.perf_counter() - t0)
+                if item is None:
+                    break
+            else:
+                items += 1
+
+        t0 = time.perf_counter()
+        pipelines[-1].close_spider(spider)
+        close_seconds = time.perf_counter() - t0
+        elapsed = time.perf_counter() - start
+
+    return {
+        "rows": rows,
+        "mode": mode,
+        "items_stored": items,
+        "items_dropped": dropped,
+        "elapsed_s": elapsed,
+        "items_per_s": items / elapsed if elapsed else 0.0,
+        "stages": {name: percentiles(values) for name, values in samples.items()},
+        "close_spider_ms": close_seconds * 1000,
+        "db_stats": {k: v for k, v in crawler.stats.get_stats().items() if k.startswith("sqlite/")},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # ru_maxrss: KiB on Linux
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'rows':>7} {'mode':>9} {'items/s':>10} {'peak MB':>8}  stage p50/p99 (us)")
+    for r in results:
+        stages = "  ".join(f"{name}={s['p50_us']:.0f}/{s['p99_us']:.0f}" for name, s in r["stages"].items() if s)
+        print(f"{r['rows']:>7} {r['mode']:>9} {r['items_per_s']:>10.0f} {r['peak_rss_mb']:>8.1f}  {stages}")
+
+
+def compare(before_path, after_path):
+    before = {(r["rows"], r["mode"]): r for r in json.loads(Path(before_path).read_text())["results"]}
+    after = json.loads(Path(after_path).read_text())["results"]
+    print(f"{'rows':>7} {'mode':>9} {'items/s before':>15} {'after':>10} {'change':>8}")
+    for r in after:
+        old = before.get((r["rows"], r["mode"]))
+        if old is None:
+            continue
+        change = (r["items_per_s"] / old["items_per_s"] - 1) * 100 if old["items_per_s"] else 0.0
+        print(f"{r['rows']:>7} {r['mode']:>9} {old['items_per_s']:>15.0f} {r['items_per_s']:>10.0f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[0, 10_000, 100_000],
+                        help="table sizes, 0 = the fixture as is (default: 0 10000 100000)")
+    parser.add_argument("--mode", nargs="+", default=["loader", "compiled"], choices=["loader", "compiled", "streaming"])
+    parser.add_argument("--output", help="write the results as json (to --compare them between commits)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two --output files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for rows in args.rows:
+        for mode in args.mode:
+            with context.Pool(1) as pool:
+                results.append(pool.apply(run_scenario, (rows, mode)))
+    print_results(results)
+
+    if args.output:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
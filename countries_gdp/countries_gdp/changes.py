@@ -0,0 +1,58 @@
+"""Content hashes for ChangeDetectionPipeline: which rows changed since the last crawl.
+
+One hash per (country_name, source), in the content_hashes table of the database the rows go to (SQLITE_DB_PATH,
+next to the countries_gdp table). The hashes aren't written here: db.write_rows writes them with the rows, in the
+same transaction (see db.CREATE_CONTENT_HASHES_SQL). So a row is only "unchanged" if the table really has it with
+these values: a crawl into another/new/deleted db file writes everything again, and a batch whose transaction failed
+isn't remembered as written.
+
+They're all loaded when the spider opens (a few hundred rows, a few KB), so checking an item is a dict lookup and
+not a query. The only write of this module: forgetting the rows gone from the page ("removed") when the spider closes.
+"""
+from itemadapter import ItemAdapter
+
+from . import db
+
+
+def content_hash(item, fields=db.COLUMNS):
+    """128-bit hash of the values of an item (the db columns), the same as db.row_hash of its row"""
+    adapter = ItemAdapter(item)
+    return db.row_hash(adapter.get(field) for field in fields)
+
+
+class ContentHashStore:
+    def __init__(self, path=db.DEFAULT_DB_PATH):
+        self.path = path
+        self.con = None
+        self.hashes = {}  # (country_name, source) -> hash of the row in the table
+
+    def open(self):
+        self.con = db.connect(self.path)
+        self.con.execute(db.CREATE_CONTENT_HASHES_SQL)
+        self.hashes = {(country_name, source): hash_ for country_name, source, hash_ in
+                       self.con.execute("SELECT country_name, source, hash FROM content_hashes")}
+
+    def check(self, key, hash_):
+        """"added", "changed" or None (unchanged), against the hashes of the rows in the db"""
+        previous = self.hashes.get(key)
+        if previous == hash_:
+            return None
+        return "added" if previous is None else "changed"
+
+    def forget(self, removed):
+        """The removed keys aren't reported again by the next crawls (and come back as "added" if they reappear)"""
+        removed = list(removed)
+        if not removed:
+            return
+        self.con.execute("BEGIN")
+        try:
+            self.con.executemany("DELETE FROM content_hashes WHERE country_name = ? AND source = ?", removed)
+        except Exception:
+            self.con.execute("ROLLBACK")
+            raise
+        self.con.execute("COMMIT")
+        for key in removed:
+            self.hashes.pop(key, None)
+
+    def close(self):
+        self.con.close()
@@ -0,0 +1,290 @@
+"""SQLite helpers shared by the pipelines.
+
+Keeping the connection setup, the table definition and the write statement in one place means every
+pipeline that touches countries_gdp.db opens it the same way (same pragmas, same schema).
+
+Pragmas (see https://www.sqlite.org/pragma.html):
+    journal_mode=WAL: readers don't block the writer and a commit is a single append to the -wal file
+    synchronous=NORMAL: in WAL mode only checkpoints fsync, commits don't -> much cheaper transactions
+    cache_size: negative value = size in KiB (-20000 -> ~20MB page cache), positive value = number of pages
+"""
+import hashlib
+import json
+import sqlite3
+
+from itemadapter import ItemAdapter
+
+DEFAULT_DB_PATH = "countries_gdp.db"
+DEFAULT_TABLE = "countries_gdp"
+
+# one row per (country, source of the estimate): IMF, World Bank, UN
+# the statements are templates on the table name: the runner (runner.py) writes every list page to its own table
+# with the same columns, the pipelines use DEFAULT_TABLE (CREATE_TABLE_SQL, INSERT_SQL, UPSERT_SQL below)
+CREATE_TABLE_TEMPLATE = """CREATE TABLE IF NOT EXISTS {table}
+        (country_name TEXT,
+        source TEXT,
+        region TEXT,
+        gdp REAL,
+        year INTEGER,
+        population INTEGER,
+        gdp_per_capita REAL,
+        scraped_at TEXT,
+        PRIMARY KEY (country_name, source))"""
+
+COLUMNS = ("country_name", "source", "region", "gdp", "year", "population", "gdp_per_capita")
+
+INSERT_TEMPLATE = f"""INSERT INTO {{table}} ({", ".join(COLUMNS)}, scraped_at)
+                VALUES ({", ".join("?" * (len(COLUMNS) + 1))})"""
+
+# upsert: a row that's already in the table is updated instead of raising IntegrityError, and only if one of its
+# values actually changed (the WHERE clause), so an unchanged row isn't rewritten and keeps its scraped_at
+# "IS NOT" instead of "!=": NULL-safe comparison (NULL != NULL is NULL, not true)
+UPSERT_TEMPLATE = INSERT_TEMPLATE + """
+                ON CONFLICT (country_name, source) DO UPDATE SET
+                    region = excluded.region,
+                    gdp = excluded.gdp,
+                    year = excluded.year,
+                    population = excluded.population,
+                    gdp_per_capita = excluded.gdp_per_capita,
+                    scraped_at = excluded.scraped_at
+                WHERE {table}.region IS NOT excluded.region
+                    OR {table}.gdp IS NOT excluded.gdp
+                    OR {table}.year IS NOT excluded.year
+                    OR {table}.population IS NOT excluded.population
+                    OR {table}.gdp_per_capita IS NOT excluded.gdp_per_capita"""
+
+WRITE_TEMPLATES = {"insert": INSERT_TEMPLATE, "upsert": UPSERT_TEMPLATE}
+
+
+def write_sql(write_mode, table=DEFAULT_TABLE):
+    # table names can't be bound with "?": they come from DEFAULT_TABLE or runner.page_slug ([a-z0-9_] only)
+    return WRITE_TEMPLATES[write_mode].format(table=table)
+
+
+CREATE_TABLE_SQL = CREATE_TABLE_TEMPLATE.format(table=DEFAULT_TABLE)
+INSERT_SQL = write_sql("insert")
+UPSERT_SQL = write_sql("upsert")
+WRITE_MODES = {"insert": INSERT_SQL, "upsert": UPSERT_SQL}
+
+# History (SQLITE_HISTORY_ENABLED): every crawl is a snapshot and its rows are appended to countries_gdp_history,
+# countries_gdp keeps the latest values only. Queries: see history.py
+CREATE_SNAPSHOTS_SQL = """CREATE TABLE IF NOT EXISTS snapshots
+        (snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        spider TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        rows INTEGER)"""
+
+# primary key (country_name, source, snapshot_id): the rows of a country are stored together in snapshot order, so
+# "the value of X as of snapshot N" and "the series of X" are range lookups on the key (WITHOUT ROWID: the table is
+# the primary key b-tree, no second copy of the rows)
+CREATE_HISTORY_SQL = """CREATE TABLE IF NOT EXISTS countries_gdp_history
+        (snapshot_id INTEGER NOT NULL REFERENCES snapshots (snapshot_id),
+        country_name TEXT NOT NULL,
+        source TEXT NOT NULL,
+        region TEXT,
+        gdp REAL,
+        year INTEGER,
+        population INTEGER,
+        gdp_per_capita REAL,
+        PRIMARY KEY (country_name, source, snapshot_id)) WITHOUT ROWID"""
+
+HISTORY_INDEXES_SQL = (
+    "CREATE INDEX IF NOT EXISTS countries_gdp_history_country_year ON countries_gdp_history (country_name, year)",
+    "CREATE INDEX IF NOT EXISTS countries_gdp_history_region_year ON countries_gdp_history (region, year)",
+    # the rows written by one snapshot (history.delta)
+    "CREATE INDEX IF NOT EXISTS countries_gdp_history_snapshot ON countries_gdp_history (snapshot_id)",
+)
+
+HISTORY_INSERT_SQL = f"""INSERT OR REPLACE INTO countries_gdp_history (snapshot_id, {", ".join(COLUMNS)})
+                VALUES ({", ".join("?" * (len(COLUMNS) + 1))})"""
+
+# Change detection (changes.py, ChangeDetectionPipeline): the content hash of every row of countries_gdp, in the same
+# file. write_rows writes them in the same transaction as the rows, so they always describe what the table has: a new
+# or deleted db file, or a batch that failed and was rolled back, can't leave hashes of rows that were never written
+CREATE_CONTENT_HASHES_SQL = """CREATE TABLE IF NOT EXISTS content_hashes
+        (country_name TEXT,
+        source TEXT,
+        hash BLOB,
+        seen_at TEXT,
+        PRIMARY KEY (country_name, source)) WITHOUT ROWID"""
+
+CONTENT_HASHES_UPSERT_SQL = """INSERT OR REPLACE INTO content_hashes (country_name, source, hash, seen_at)
+                VALUES (?, ?, ?, ?)"""
+
+# GDP_SKIP_UNCHANGED (GdpSpider.parse): the pages whose items are all in this db file, with the fingerprint of the
+# body they were parsed from. Written by write_rows in the transaction of the page's last rows: a 304 from the http
+# cache only means "same page as last time", this says the last time's rows really are here (not in a deleted db,
+# another SQLITE_DB_PATH or a killed crawl)
+CREATE_PARSED_PAGES_SQL = """CREATE TABLE IF NOT EXISTS parsed_pages
+        (url TEXT PRIMARY KEY,
+        fingerprint BLOB,
+        parsed_at TEXT)"""
+
+PARSED_PAGES_UPSERT_SQL = "INSERT OR REPLACE INTO parsed_pages (url, fingerprint, parsed_at) VALUES (?, ?, ?)"
+
+# Revision backfill (spiders/gdp_revisions.py): the table as it was in every past revision of the page
+# revisions: one row per revision fully written, the checkpoint a resumed backfill reads to skip what's done
+CREATE_REVISIONS_SQL = """CREATE TABLE IF NOT EXISTS revisions
+        (revision_id INTEGER PRIMARY KEY,
+        parent_id INTEGER,
+        timestamp TEXT,
+        rows INTEGER,
+        fetched_at TEXT)"""
+
+CREATE_REVISION_ROWS_SQL = """CREATE TABLE IF NOT EXISTS countries_gdp_revisions
+        (revision_id INTEGER NOT NULL REFERENCES revisions (revision_id),
+        country_name TEXT NOT NULL,
+        source TEXT NOT NULL,
+        region TEXT,
+        gdp REAL,
+        year INTEGER,
+        population INTEGER,
+        gdp_per_capita REAL,
+        PRIMARY KEY (revision_id, country_name, source)) WITHOUT ROWID"""
+
+REVISION_INDEXES_SQL = (
+    # the series of a country across the revisions
+    "CREATE INDEX IF NOT EXISTS countries_gdp_revisions_country ON countries_gdp_revisions (country_name, source)",
+)
+
+REVISION_ROWS_INSERT_SQL = f"""INSERT OR REPLACE INTO countries_gdp_revisions (revision_id, {", ".join(COLUMNS)})
+                VALUES ({", ".join("?" * (len(COLUMNS) + 1))})"""
+
+
+def connect(path=DEFAULT_DB_PATH, journal_mode="WAL", synchronous="NORMAL", cache_size=-20000):
+    # isolation_level=None: no implicit transactions, we open them ourselves with BEGIN in write_rows
+    con = sqlite3.connect(path, isolation_level=None)
+    # pragma values can't be bound with "?", they come from settings.py, not from scraped data
+    con.execute(f"PRAGMA journal_mode={journal_mode}")
+    con.execute(f"PRAGMA synchronous={synchronous}")
+    con.execute(f"PRAGMA cache_size={int(cache_size)}")
+    return con
+
+
+def create_table(con, table=DEFAULT_TABLE):
+    if table == DEFAULT_TABLE:
+        columns = {row[1] for row in con.execute("PRAGMA table_info(countries_gdp)")}
+        if columns and "source" not in columns:
+            migrate_single_source_table(con, columns)
+    con.execute(CREATE_TABLE_TEMPLATE.format(table=table))
+    if table == DEFAULT_TABLE:
+        con.execute(CREATE_CONTENT_HASHES_SQL)
+        con.execute(CREATE_PARSED_PAGES_SQL)
+
+
+def create_history_tables(con):
+    con.execute(CREATE_SNAPSHOTS_SQL)
+    con.execute(CREATE_HISTORY_SQL)
+    for sql in HISTORY_INDEXES_SQL:
+        con.execute(sql)
+
+
+def start_snapshot(con, spider_name, started_at):
+    """Record a new snapshot, returns its snapshot_id"""
+    return con.execute("INSERT INTO snapshots (spider, started_at, rows) VALUES (?, ?, 0)",
+                       (spider_name, started_at)).lastrowid
+
+
+def finish_snapshot(con, snapshot_id, finished_at):
+    con.execute("""UPDATE snapshots SET finished_at = ?,
+                       rows = (SELECT count(*) FROM countries_gdp_history WHERE snapshot_id = ?)
+                   WHERE snapshot_id = ?""", (finished_at, snapshot_id, snapshot_id))
+
+
+def create_revision_tables(con):
+    con.execute(CREATE_REVISIONS_SQL)
+    con.execute(CREATE_REVISION_ROWS_SQL)
+    for sql in REVISION_INDEXES_SQL:
+        con.execute(sql)
+
+
+def done_revisions(con):
+    """The revision_ids already written (none if the tables don't exist yet)"""
+    if not con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'revisions'").fetchone():
+        return set()
+    return {revision_id for revision_id, in con.execute("SELECT revision_id FROM revisions")}
+
+
+def write_revision(con, revision, rows, fetched_at):
+    """The rows of a revision and its checkpoint in one transaction: a revision is either completely in the db
+    (and skipped by the next run) or not at all (and fetched again)"""
+    con.execute("BEGIN")
+    try:
+        con.executemany(REVISION_ROWS_INSERT_SQL, [(revision["revision_id"],) + row[:-1] for row in rows])
+        con.execute("INSERT OR REPLACE INTO revisions (revision_id, parent_id, timestamp, rows, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (revision["revision_id"], revision.get("parent_id"), revision.get("timestamp"), len(rows),
+                     fetched_at))
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+def migrate_single_source_table(con, columns):
+    """countries_gdp.db files from before the sources: one row per country (PRIMARY KEY country_name), the IMF
+    estimate. The primary key can't be altered in SQLite: copy the rows into the new table (source = "IMF")"""
+    scraped_at = "scraped_at" if "scraped_at" in columns else "NULL"
+    con.execute("BEGIN")
+    try:
+        con.execute("ALTER TABLE countries_gdp RENAME TO countries_gdp_single_source")
+        con.execute(CREATE_TABLE_SQL)
+        con.execute(f"""INSERT INTO countries_gdp (country_name, source, region, gdp, year, scraped_at)
+                        SELECT country_name, 'IMF', region, gdp, year, {scraped_at} FROM countries_gdp_single_source""")
+        con.execute("DROP TABLE countries_gdp_single_source")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+def item_to_row(item, scraped_at=None):
+    # .get: fields without a value (i.e. no year in the table, no population without GDP_FOLLOW_COUNTRIES) -> NULL
+    adapter = ItemAdapter(item)
+    return tuple(adapter.get(column) for column in COLUMNS) + (scraped_at,)
+
+
+def row_hash(values):
+    """128-bit hash of the values of a row (COLUMNS order), stable across runs"""
+    data = json.dumps(list(values), ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).digest()
+
+
+def body_fingerprint(body):
+    """128-bit hash of a response body (bytes), what parsed_pages keeps"""
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def parsed_page_fingerprint(con, url):
+    """The fingerprint of the body the rows of `url` in this db were parsed from, None if it was never written"""
+    if not con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'parsed_pages'").fetchone():
+        return None
+    row = con.execute("SELECT fingerprint FROM parsed_pages WHERE url = ?", (url,)).fetchone()
+    return row[0] if row else None
+
+
+def write_rows(con, rows, sql=INSERT_SQL, snapshot_id=None, content_hashes=False, pages=()):
+    """Write all the rows in a single transaction: one commit (one fsync at most) per batch instead of per row.
+    With a snapshot_id the rows are also appended to countries_gdp_history, in the same transaction.
+    With content_hashes the hashes of the rows are written to content_hashes, in the same transaction too.
+    pages: (url, fingerprint, parsed_at) of the pages whose last rows are in this batch -> parsed_pages, same transaction
+    Returns the number of rows actually inserted/updated in countries_gdp (with UPSERT_SQL unchanged rows aren't counted)"""
+    con.execute("BEGIN")
+    try:
+        changes_before = con.total_changes
+        con.executemany(sql, rows)
+        changed = con.total_changes - changes_before
+        if snapshot_id is not None:
+            # the rows without their scraped_at: the snapshot has the time
+            con.executemany(HISTORY_INSERT_SQL, [(snapshot_id,) + row[:-1] for row in rows])
+        if content_hashes:
+            # row: COLUMNS (country_name, source first) + scraped_at
+            con.executemany(CONTENT_HASHES_UPSERT_SQL, [row[:2] + (row_hash(row[:-1]), row[-1]) for row in rows])
+        if pages:
+            con.executemany(PARSED_PAGES_UPSERT_SQL, pages)
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+    return changed
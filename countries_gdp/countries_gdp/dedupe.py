@@ -0,0 +1,215 @@
+"""Duplicate detection backends for NoDuplicateCountryPipeline.
+
+The pipeline builds a key from DEDUPE_KEY_FIELDS (i.e. ("country_name", "source") or ("country_name", "source", "year")
+for history crawls) and asks the backend (DEDUPE_BACKEND) whether it has seen it.
+
+    "memory": the exact keys in a python set. Exact, ~200+ bytes per key, one crawl only (the default)
+    "hashed": 64-bit fingerprints of the keys in an open-addressing table (array of uint64), 8-16 bytes per key,
+              one crawl only. A false positive needs two different keys with the same 64-bit hash (~n / 2**64)
+    "bloom": Bloom filter sized for DEDUPE_BLOOM_CAPACITY keys at DEDUPE_BLOOM_ERROR_RATE false positives, a fixed
+             ~1.2 bytes per key at 1%. Saved to DEDUPE_BLOOM_PATH when the spider closes (and loaded back when it
+             opens) if it's set: dedupe across runs
+    "sqlite": 64-bit fingerprints in a table of DEDUPE_SQLITE_PATH, survives restarts: dedupe across runs, the memory
+              used is SQLite's page cache only
+
+Each backend reports its size in the stats when the spider closes: dedupe/keys, dedupe/memory_bytes,
+dedupe/estimated_false_positive_rate. "sqlite" reports dedupe/disk_bytes (the size of its table's db file) and
+dedupe/cache_limit_bytes (the page cache's cap, cache_size) instead of memory_bytes: SQLite doesn't tell how much of
+the cache a connection really uses.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import sys
+from array import array
+
+from . import db
+from .paths import optional_path
+
+
+def fingerprint(key):
+    """64-bit hash of a key (tuple of field values), stable across runs (unlike hash())"""
+    data = "\x1f".join("" if value is None else str(value) for value in key).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class MemorySetBackend:
+    def __init__(self):
+        self.keys = set()
+
+    def open(self):
+        pass
+
+    def add(self, key):
+        """True if the key is new (and remembers it), False if it was seen before"""
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self):
+        memory = sys.getsizeof(self.keys) + sum(
+            sys.getsizeof(key) + sum(sys.getsizeof(value) for value in key) for key in self.keys)
+        return {"keys": len(self.keys), "memory_bytes": memory, "estimated_false_positive_rate": 0.0}
+
+
+class HashedSetBackend:
+    EMPTY = 0  # fingerprint 0 is stored as 1, so 0 can mark the empty slots
+
+    def __init__(self, initial_size=1024):
+        self.table = array("Q", bytes(8 * initial_size))
+        self.mask = initial_size - 1  # size: power of 2, slot = fingerprint & mask
+        self.count = 0
+
+    def open(self):
+        pass
+
+    def add(self, key):
+        return self._insert(fingerprint(key) or 1)
+
+    def _insert(self, value):
+        table, mask = self.table, self.mask
+        slot = value & mask
+        while True:
+            current = table[slot]
+            if current == value:
+                return False
+            if current == self.EMPTY:
+                break
+            slot = (slot + 1) & mask  # linear probing
+
+        table[slot] = value
+        self.count += 1
+        if self.count * 2 > len(table):  # keep the load factor under 1/2: short probe sequences
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self.table
+        self.table = array("Q", bytes(8 * len(old) * 2))
+        self.mask = len(self.table) - 1
+        self.count = 0
+        for value in old:
+            if value != self.EMPTY:
+                self._insert(value)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"keys": self.count, "memory_bytes": self.table.buffer_info()[1] * self.table.itemsize,
+                "estimated_false_positive_rate": self.count / 2 ** 64}
+
+
+class BloomFilterBackend:
+    def __init__(self, capacity=1_000_000, error_rate=0.01, path=None):
+        # optimal sizes: m = -n ln(p) / ln(2)^2 bits, k = m/n ln(2) hash functions
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.path = path
+        self.filter = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def open(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                saved = f.read()
+            if len(saved) == len(self.filter) + 8:
+                self.count = int.from_bytes(saved[:8], "little")
+                self.filter = bytearray(saved[8:])
+            # a filter saved with another capacity/error rate can't be reused: start from an empty one
+
+    def _positions(self, key):
+        # double hashing: k positions from 2 independent 64-bit hashes (Kirsch & Mitzenmacher)
+        data = "\x1f".join("" if value is None else str(value) for value in key).encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        if all(self.filter[p >> 3] & (1 << (p & 7)) for p in positions):
+            return False  # seen (or a false positive)
+        for p in positions:
+            self.filter[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        return True
+
+    def close(self):
+        if self.path:
+            with open(self.path, "wb") as f:
+                f.write(self.count.to_bytes(8, "little"))
+                f.write(self.filter)
+
+    def stats(self):
+        rate = (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+        return {"keys": self.count, "memory_bytes": len(self.filter), "estimated_false_positive_rate": rate}
+
+
+class SqliteBackend:
+    CREATE_TABLE_SQL = "CREATE TABLE IF NOT EXISTS dedupe_keys (fingerprint INTEGER PRIMARY KEY)"
+
+    def __init__(self, path="dedupe.db", commit_every=1000):
+        self.path = path
+        self.commit_every = commit_every
+        self.con = None
+        self.pending = 0
+
+    def open(self):
+        self.con = db.connect(self.path)
+        self.con.execute(self.CREATE_TABLE_SQL)
+        self.con.execute("BEGIN")
+
+    def add(self, key):
+        # INTEGER PRIMARY KEY is a signed 64-bit int: store the fingerprint as one
+        value = fingerprint(key)
+        if value >= 2 ** 63:
+            value -= 2 ** 64
+        cursor = self.con.execute("INSERT OR IGNORE INTO dedupe_keys (fingerprint) VALUES (?)", (value,))
+        if cursor.rowcount == 0:
+            return False
+
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            # a commit per key would be an fsync per item: commit in batches (a crash loses the last batch of keys,
+            # those items would only be accepted again on the next run)
+            self.con.execute("COMMIT")
+            self.con.execute("BEGIN")
+            self.pending = 0
+        return True
+
+    def close(self):
+        self.con.execute("COMMIT")
+        self.con.close()
+
+    def stats(self):
+        try:
+            keys = self.con.execute("SELECT count(*) FROM dedupe_keys").fetchone()[0]
+            page_size = self.con.execute("PRAGMA page_size").fetchone()[0]
+            page_count = self.con.execute("PRAGMA page_count").fetchone()[0]
+            cache_size = self.con.execute("PRAGMA cache_size").fetchone()[0]
+        except sqlite3.ProgrammingError:  # closed
+            return {}
+        # cache_size: negative = KiB, positive = pages
+        cache_limit = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+        return {"keys": keys, "disk_bytes": page_count * page_size, "cache_limit_bytes": cache_limit,
+                "estimated_false_positive_rate": keys / 2 ** 64}
+
+
+def build_backend(settings):
+    name = settings.get("DEDUPE_BACKEND", "memory")
+    if name == "memory":
+        return MemorySetBackend()
+    if name == "hashed":
+        return HashedSetBackend()
+    if name == "bloom":
+        return BloomFilterBackend(capacity=settings.getint("DEDUPE_BLOOM_CAPACITY", 1_000_000),
+                                  error_rate=settings.getfloat("DEDUPE_BLOOM_ERROR_RATE", 0.01),
+                                  path=optional_path(settings, "DEDUPE_BLOOM_PATH"))
+    if name == "sqlite":
+        return SqliteBackend(path=settings.get("DEDUPE_SQLITE_PATH", "dedupe.db"))
+    raise ValueError(f"Unknown DEDUPE_BACKEND {name!r}, expected memory, hashed, bloom or sqlite")
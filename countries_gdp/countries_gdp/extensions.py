@@ -0,0 +1,229 @@
+"""Live metrics of a running crawl, in the Prometheus text format and/or as periodic JSON snapshots.
+
+    scrapy crawl gdp_revisions
+    curl http://127.0.0.1:9410/metrics          (METRICS_HOST, METRICS_PORT in settings.py)
+
+What's exported (every metric name starts with countries_gdp_):
+    requests_in_flight             requests being downloaded right now
+    downloader_active              requests in the downloader (waiting for a download slot or being downloaded)
+    scheduler_pending              requests in the scheduler, not sent to the downloader yet
+    scraper_active                 responses being parsed, items_in_pipelines: items going through the pipelines
+    sqlite_queue_depth             rows waiting for AsyncSaveToDatabasePipeline's writer thread (and any other gauge
+                                   registered with instrumentation.Instrumentation.gauge)
+    download_latency_ms, response_size_bytes, parse_ms, sqlite_flush_ms       histograms (instrumentation.py)
+    pipeline_ms{pipeline=...}                                                 histogram, time in each process_item
+    pipeline_items_total{pipeline=..., outcome="passed"|"dropped"|"failed"}   items per pipeline
+    responses_total{status=...}                                               responses per http status
+    stat{stat=...}                 every numeric value of the scrapy stats (item_scraped_count, sqlite/flushes, ...)
+
+A stall shows up as: requests_in_flight at 0 with scheduler_pending > 0 (throttled), or items_in_pipelines and
+sqlite_queue_depth growing (the db can't keep up).
+
+The endpoint is served by twisted.web on the crawl's reactor: a scrape reads the values from the thread that
+updates them (except sqlite_flush_ms, observed by the async db writer thread: the dicts are copied before being
+read). Only 127.0.0.1 by default. If the port is taken (another crawl running) the crawl goes on without the
+endpoint, with a warning.
+
+METRICS_SNAPSHOT_PATH: every METRICS_SNAPSHOT_INTERVAL seconds (and when the spider closes) the same values are
+appended to this file as one JSON line, i.e. to look at the throughput of a backfill afterwards.
+"""
+import json
+import logging
+import re
+from datetime import datetime, timezone
+from numbers import Number
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.error import CannotListenError
+from twisted.internet.task import LoopingCall
+from twisted.web import resource, server
+
+from . import instrumentation
+from .paths import optional_path
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "countries_gdp_"
+# instrumentation names -> metric name + labels, the others keep their name (non [a-zA-Z0-9_] characters -> "_")
+LABELLED_NAMES = (
+    (re.compile(r"pipeline/(?P<pipeline>\w+)_ms$"), "pipeline_ms"),
+    (re.compile(r"pipeline/(?P<pipeline>\w+)/(?P<outcome>\w+)$"), "pipeline_items_total"),
+    (re.compile(r"responses/(?P<status>\d+)$"), "responses_total"),
+)
+INVALID_CHARACTERS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(name):
+    """instrumentation name -> (metric name, {label: value})"""
+    for pattern, metric in LABELLED_NAMES:
+        match = pattern.match(name)
+        if match:
+            return PREFIX + metric, match.groupdict()
+    return PREFIX + INVALID_CHARACTERS.sub("_", name), {}
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def numeric_stats(stats):
+    # bools are numbers too, datetimes (start_time) aren't: only the counters and the measures
+    return {name: value for name, value in stats.get_stats().items()
+            if isinstance(value, Number) and not isinstance(value, bool)}
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, exporter):
+        super().__init__()
+        self.exporter = exporter
+
+    def render_GET(self, request):
+        if request.path != b"/metrics":
+            request.setResponseCode(404)
+            return b"try /metrics\n"
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return self.exporter.render().encode("utf-8")
+
+
+class MetricsExporter:
+    # EXTENSIONS in settings.py, METRICS_ENABLED = False to turn it off
+    # the values come from instrumentation.py (histograms/counters/gauges fed by the middlewares and the pipelines),
+    # the scrapy stats and the engine (downloader, scheduler, scraper)
+
+    def __init__(self, crawler, host="127.0.0.1", port=9410, snapshot_path=None, snapshot_interval=30.0):
+        self.crawler = crawler
+        self.instrumentation = instrumentation.for_crawler(crawler)
+        self.host = host
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.listening_port = None
+        self.snapshot_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured("METRICS_ENABLED is off")
+        exporter = cls(
+            crawler,
+            host=settings.get("METRICS_HOST", "127.0.0.1"),
+            port=settings.getint("METRICS_PORT", 9410),
+            snapshot_path=optional_path(settings, "METRICS_SNAPSHOT_PATH"),
+            snapshot_interval=settings.getfloat("METRICS_SNAPSHOT_INTERVAL", 30.0),
+        )
+        crawler.signals.connect(exporter.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(exporter.spider_closed, signal=signals.spider_closed)
+        return exporter
+
+    def spider_opened(self, spider):
+        from twisted.internet import reactor
+
+        if self.port:
+            try:
+                self.listening_port = reactor.listenTCP(self.port, server.Site(MetricsResource(self)),
+                                                        interface=self.host)
+                logger.info(f"Metrics at http://{self.host}:{self.port}/metrics")
+            except CannotListenError as e:
+                logger.warning(f"Metrics endpoint not started, {self.host}:{self.port} unavailable: {e}")
+        if self.snapshot_path:
+            self.snapshot_task = LoopingCall(self.write_snapshot)
+            self.snapshot_task.start(self.snapshot_interval, now=False)
+
+    async def spider_closed(self, spider):
+        if self.snapshot_task is not None and self.snapshot_task.running:
+            self.snapshot_task.stop()
+        if self.snapshot_path:
+            self.write_snapshot()  # the final values
+        if self.listening_port is not None:
+            await maybe_deferred_to_future(self.listening_port.stopListening())  # the port is free for the next crawl
+
+    def engine_gauges(self):
+        """The queues of the engine right now (0 before the engine has started or after it stopped)"""
+        engine = self.crawler.engine
+        gauges = {"requests_in_flight": 0, "downloader_active": 0, "scheduler_pending": 0, "scraper_active": 0,
+                  "items_in_pipelines": 0}
+        if engine is None:
+            return gauges
+        downloader = engine.downloader
+        gauges["requests_in_flight"] = sum(len(slot.transferring) for slot in downloader.slots.values())
+        gauges["downloader_active"] = len(downloader.active)
+        scheduler = engine.scheduler
+        if scheduler is not None and hasattr(scheduler, "__len__"):
+            gauges["scheduler_pending"] = len(scheduler)
+        slot = engine.scraper.slot
+        if slot is not None:
+            gauges["scraper_active"] = len(slot.active)
+            gauges["items_in_pipelines"] = slot.itemproc_size
+        return gauges
+
+    def gauges(self):
+        gauges = self.engine_gauges()
+        for name, read in self.instrumentation.gauges.items():
+            gauges[name] = read()
+        return gauges
+
+    def render(self):
+        """All the metrics, Prometheus text format"""
+        lines = []
+        for name, value in self.gauges().items():
+            metric, labels = metric_name(name)
+            lines += [f"# TYPE {metric} gauge", f"{metric}{format_labels(labels)} {format_value(value)}"]
+
+        families = {}  # samples of a metric family must be together, under one TYPE line
+        for name, count in list(self.instrumentation.counters.items()):
+            metric, labels = metric_name(name)
+            families.setdefault((metric, "counter"), []).append(f"{metric}{format_labels(labels)} {count}")
+        for name, histogram in list(self.instrumentation.histograms.items()):
+            metric, labels = metric_name(name)
+            families.setdefault((metric, "histogram"), []).extend(self.histogram_samples(metric, labels, histogram))
+        for (metric, kind), samples in families.items():
+            lines.append(f"# TYPE {metric} {kind}")
+            lines += samples
+
+        lines.append(f"# TYPE {PREFIX}stat untyped")
+        for name, value in numeric_stats(self.crawler.stats).items():
+            lines.append(f"{PREFIX}stat{format_labels({'stat': name})} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def histogram_samples(metric, labels, histogram):
+        # cumulative buckets: le="5" counts every value <= 5
+        samples = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            samples.append(f"{metric}_bucket{format_labels({**labels, 'le': format_value(bound)})} {cumulative}")
+        samples.append(f"{metric}_bucket{format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+        samples.append(f"{metric}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+        samples.append(f"{metric}_count{format_labels(labels)} {histogram.count}")
+        return samples
+
+    def snapshot(self):
+        return {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "spider": self.crawler.spider.name if self.crawler.spider else None,
+            "gauges": self.gauges(),
+            "counters": dict(self.instrumentation.counters),
+            "histograms": {name: {"count": histogram.count, "sum": round(histogram.sum, 3),
+                                  "p50": round(histogram.percentile(0.50), 3),
+                                  "p95": round(histogram.percentile(0.95), 3), "max": round(histogram.max, 3)}
+                           for name, histogram in list(self.instrumentation.histograms.items())},
+            "stats": numeric_stats(self.crawler.stats),
+        }
+
+    def write_snapshot(self):
+        with open(self.snapshot_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
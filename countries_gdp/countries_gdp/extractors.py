@@ -0,0 +1,228 @@
+"""Compiled extraction of the GDP table: an alternative to the ItemLoader loop in GdpSpider.parse.
+
+The ItemLoader way does, for every <tr>: create an ItemLoader per source, run a css query per field (each one
+translated to xpath and evaluated on its own), then run the input processors field by field.
+
+The compiled way:
+    * the row query is translated from css to xpath once (at import) and compiled with lxml.etree.XPath
+    * every row is read in one pass over its cells (element children: same counting as :nth-child)
+    * the items.py processors run column by column (all the country names, then all the regions, ...)
+
+The cells are serialized the same way parsel does for .get() and the processors are the ones declared on the item,
+so the items are identical to the ones the ItemLoader way produces.
+
+usage: scrapy crawl gdp -a extraction_mode=compiled   (or GDP_EXTRACTION_MODE = "compiled" in settings.py)
+
+With a record class (items.CountriesGdpRecord) instead of an item class, the rows are read one at a time and every
+value is parsed on its own (parse_value/first_value): no list of values per field, one record built per source.
+"""
+import dataclasses
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+from .items import CountriesGdpItem
+
+ROWS_CSS = "table.wikitable.sortable tbody tr:not([class])"  # not([attr]): elem without attr
+ROWS_XPATH = etree.XPath(HTMLTranslator().css_to_xpath(ROWS_CSS))
+CELLS_XPATH = etree.XPath("*")  # element children of the row, comments/text aren't counted (like :nth-child)
+
+# Country/Territory | UN region | IMF estimate, year | World Bank estimate, year | United Nations estimate, year
+# field -> nth-child position of the td, only its <a> elements are kept: same as add_css("country_name", "td:nth-child(1) a")
+COUNTRY_COLUMNS = {
+    "country_name": 1,
+    "region": 2,
+}
+# source -> table columns of its (gdp, year). Table columns, not cells: a source without estimate is a single
+# <td colspan="2">—</td> cell, so the cells after it are shifted by one (see spread_colspans)
+SOURCE_COLUMNS = {
+    "IMF": (3, 4),
+    "World Bank": (5, 6),
+    "UN": (7, 8),
+}
+
+
+def to_html(element):
+    # exactly what parsel's Selector.get() returns for an element
+    return etree.tostring(element, method="html", encoding="unicode", with_tail=False)
+
+
+def spread_colspans(cells, colspan=lambda cell: cell.get("colspan")):
+    """Cells -> table columns: a cell with colspan="2" fills 2 columns. cells[i] is table column i + 1
+    (works for lxml elements and parsel Selectors: colspan reads the attribute)"""
+    columns = []
+    for cell in cells:
+        span = colspan(cell)
+        columns.extend([cell] * (int(span) if span and span.isdigit() else 1))
+    return columns
+
+
+def link_values(cells, position):
+    """The values add_css("...", "td:nth-child(n) a") collects for one row: the html of every <a> of the td"""
+    if len(cells) < position or cells[position - 1].tag != "td":
+        return []
+    return [to_html(a) for a in cells[position - 1].iterdescendants("a")]
+
+
+def column_values(columns, position):
+    if len(columns) < position or columns[position - 1].tag != "td":
+        return []
+    return [to_html(columns[position - 1])]
+
+
+def country_href(cells):
+    # first link of the first cell: the country's article (what response.follow needs)
+    if not cells or cells[0].tag != "td":
+        return None
+    for a in cells[0].iterdescendants("a"):
+        return a.get("href")
+    return None
+
+
+def process_column(item_cls, field, column):
+    """Run the field's input + output processors over a whole column (one list of raw values per row)"""
+    meta = item_cls.fields[field]
+    input_processor = meta.get("input_processor")
+    output_processor = meta.get("output_processor")
+    processed = []
+    for values in column:
+        if input_processor is not None:
+            values = input_processor(values)
+        # ItemLoader only keeps the values that survived the input processor
+        value = output_processor(values) if output_processor is not None else values
+        processed.append(value)
+    return processed
+
+
+def build_item(item_cls, values):
+    # like ItemLoader.load_item(): a field without value isn't set at all
+    item = item_cls()
+    for field, value in values.items():
+        if value is not None:
+            item[field] = value
+    return item
+
+
+def extract_rows(root):
+    """Read every cell we care about, one pass per row.
+    Returns {column: [raw values of row 0, row 1, ...]} where column is a field of COUNTRY_COLUMNS,
+    "href" or (source, "gdp"/"year")"""
+    columns = {field: [] for field in COUNTRY_COLUMNS}
+    columns["href"] = []
+    for source in SOURCE_COLUMNS:
+        columns[source, "gdp"] = []
+        columns[source, "year"] = []
+
+    for row in ROWS_XPATH(root):
+        for key, values in read_row(row).items():
+            columns[key].append(values)
+    return columns
+
+
+def read_row(row):
+    """The raw values of one <tr>: {column: values}, same keys as extract_rows"""
+    cells = CELLS_XPATH(row)
+    values = {field: link_values(cells, position) for field, position in COUNTRY_COLUMNS.items()}
+    values["href"] = country_href(cells)
+
+    table_columns = spread_colspans(cells)
+    for source, (gdp_position, year_position) in SOURCE_COLUMNS.items():
+        values[source, "gdp"] = column_values(table_columns, gdp_position)
+        values[source, "year"] = column_values(table_columns, year_position)
+    return values
+
+
+def extract_countries(response, item_cls=CountriesGdpItem):
+    """Yields (country article href, [one item per source]) for every row of the table"""
+    if is_record(item_cls):
+        yield from extract_records(response.selector.root, item_cls)
+        return
+    columns = extract_rows(response.selector.root)
+    processed = {}
+    for key, column in columns.items():
+        if key == "href":
+            continue
+        field = key[1] if isinstance(key, tuple) else key
+        processed[key] = process_column(item_cls, field, column)
+    sources = {source: process_column(item_cls, "source", [[source]])[0] for source in SOURCE_COLUMNS}
+
+    for i, href in enumerate(columns["href"]):
+        items = []
+        for source in SOURCE_COLUMNS:
+            # same fields, same order as the ItemLoader: country_name, region, gdp, year, source
+            values = {field: processed[field][i] for field in COUNTRY_COLUMNS}
+            values["gdp"] = processed[source, "gdp"][i]
+            values["year"] = processed[source, "year"][i]
+            values["source"] = sources[source]
+
+            items.append(build_item(item_cls, values))
+        yield href, items
+
+
+def is_record(item_cls):
+    # a record class (items.CountriesGdpRecord: dataclass) rather than a scrapy.Item class
+    return dataclasses.is_dataclass(item_cls)
+
+
+def record_parsers(record_cls):
+    """field -> the function parsing one raw value of the field (the "parse" metadata of the record's fields)"""
+    return {field.name: field.metadata.get("parse") for field in dataclasses.fields(record_cls)}
+
+
+def parse_value(parse, raw):
+    # MapCompose(parse) + TakeFirst() on a single value, without their lists: None and "" are no value
+    if raw is None:
+        return None
+    value = parse(raw)
+    return None if value == "" else value
+
+
+def first_value(parse, raws):
+    # the same over several raw values (i.e. the links of a cell): the first one that gives a value
+    for raw in raws:
+        value = parse_value(parse, raw)
+        if value is not None:
+            return value
+    return None
+
+
+def cell_links(cells, position):
+    # the html of the <a> elements of a td, lazily: first_value stops at the first useful one
+    if len(cells) < position or cells[position - 1].tag != "td":
+        return ()
+    return (to_html(a) for a in cells[position - 1].iterdescendants("a"))
+
+
+def cell_html(columns, position):
+    if len(columns) < position or columns[position - 1].tag != "td":
+        return None
+    return to_html(columns[position - 1])
+
+
+def row_records(row, record_cls, parsers):
+    """One <tr> -> (country article href, [one record per source]), same values as the items of the row"""
+    cells = CELLS_XPATH(row)
+    country_name = first_value(parsers["country_name"], cell_links(cells, COUNTRY_COLUMNS["country_name"]))
+    region = first_value(parsers["region"], cell_links(cells, COUNTRY_COLUMNS["region"]))
+    table_columns = spread_colspans(cells)
+    records = []
+    for source, (gdp_position, year_position) in SOURCE_COLUMNS.items():
+        records.append(record_cls(
+            country_name=country_name,
+            region=region,
+            gdp=parse_value(parsers["gdp"], cell_html(table_columns, gdp_position)),
+            year=parse_value(parsers["year"], cell_html(table_columns, year_position)),
+            source=parse_value(parsers["source"], source),
+        ))
+    return country_href(cells), records
+
+
+def extract_records(root, record_cls):
+    parsers = record_parsers(record_cls)
+    for row in ROWS_XPATH(root):
+        yield row_records(row, record_cls, parsers)
+
+
+def extract_items(response, item_cls=CountriesGdpItem):
+    for _, items in extract_countries(response, item_cls):
+        yield from items
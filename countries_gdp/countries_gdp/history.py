@@ -0,0 +1,178 @@
+"""Queries over the snapshots of countries_gdp_history (SQLITE_HISTORY_ENABLED = True in settings.py).
+
+    python -m countries_gdp.history snapshots
+    python -m countries_gdp.history top Europe -n 10 [--source IMF] [--snapshot 12] [--year 2023]
+    python -m countries_gdp.history delta 11 12 [--source IMF] [--region Asia]
+    python -m countries_gdp.history series "United States" [--source IMF] [--year 2023]
+    (--db path/to/countries_gdp.db, --explain: print SQLite's query plan instead of running the query)
+
+or from python (i.e. a dashboard), every function returns a list of dicts (pandas.DataFrame(rows) if needed):
+
+    con = db.connect("countries_gdp.db")
+    history.top(con, "Europe", n=10)
+
+A snapshot doesn't always hold every country: an unchanged page isn't parsed (GDP_SKIP_UNCHANGED), so its snapshot
+has no rows at all, and with CHANGE_DETECTION_ENABLED a snapshot only has the rows that changed. The value of a
+country "as of" snapshot N is its row in the latest snapshot <= N, found with one lookup on the primary key
+(country_name, source, snapshot_id), and every query works that way. No query reads
+the whole table: top goes through the (region, year) index, delta through the snapshot_id one, series through the
+primary key or the (country_name, year) index. Check with --explain: SEARCH ... USING INDEX, never SCAN.
+"""
+import argparse
+import sys
+
+from . import db
+
+LATEST = 2 ** 63 - 1  # "as of" the latest snapshot: no snapshot_id is above it
+
+# snapshot_id of the row holding the value of (country_name, source) of the outer row "h" as of :snapshot
+AS_OF_SQL = """(SELECT max(snapshot_id) FROM countries_gdp_history
+                    WHERE country_name = {alias}.country_name AND source = {alias}.source AND snapshot_id <= {bound})"""
+
+
+def fetch(con, sql, params):
+    cursor = con.execute(sql, params)
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def explain(con, sql, params):
+    """SQLite's plan for the query, one line per step (detail column of EXPLAIN QUERY PLAN)"""
+    return [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def snapshots_query():
+    return "SELECT snapshot_id, spider, started_at, finished_at, rows FROM snapshots ORDER BY snapshot_id", {}
+
+
+def top_query(region, n=10, source="IMF", snapshot_id=None, year=None):
+    """The n largest GDPs of a region as of a snapshot (default: the latest one)"""
+    conditions = ["h.region = :region"]
+    if year is not None:
+        conditions.append("h.year = :year")  # (region, year): both columns of the index
+    sql = f"""SELECT h.country_name, h.gdp, h.year, h.snapshot_id
+              FROM countries_gdp_history AS h
+              WHERE {" AND ".join(conditions)} AND h.source = :source AND h.gdp IS NOT NULL
+                AND h.snapshot_id = {AS_OF_SQL.format(alias="h", bound=":snapshot")}
+              ORDER BY h.gdp DESC
+              LIMIT :n"""
+    params = {"region": region, "n": n, "source": source, "year": year,
+              "snapshot": LATEST if snapshot_id is None else snapshot_id}
+    return sql, params
+
+
+def delta_query(from_snapshot, to_snapshot, source=None, region=None):
+    """The countries whose GDP changed between 2 snapshots, largest changes first.
+    Only the rows written after from_snapshot are read (snapshot_id index), each compared with its value as of
+    from_snapshot (NULL: the country/source wasn't there yet)"""
+    conditions = ["b.snapshot_id > :from_snapshot", "b.snapshot_id <= :to_snapshot"]
+    if source is not None:
+        conditions.append("b.source = :source")
+    if region is not None:
+        conditions.append("b.region = :region")
+    sql = f"""SELECT b.country_name, b.source, b.region, a.gdp AS gdp_before, b.gdp AS gdp_after,
+                     b.gdp - a.gdp AS gdp_delta, b.snapshot_id
+              FROM countries_gdp_history AS b
+              LEFT JOIN countries_gdp_history AS a
+                  ON a.country_name = b.country_name AND a.source = b.source
+                  AND a.snapshot_id = {AS_OF_SQL.format(alias="b", bound=":from_snapshot")}
+              WHERE {" AND ".join(conditions)}
+                AND b.snapshot_id = {AS_OF_SQL.format(alias="b", bound=":to_snapshot")}
+                AND b.gdp IS NOT a.gdp
+              ORDER BY abs(coalesce(b.gdp - a.gdp, b.gdp, a.gdp)) DESC"""
+    params = {"from_snapshot": from_snapshot, "to_snapshot": to_snapshot, "source": source, "region": region}
+    return sql, params
+
+
+def series_query(country_name, source=None, year=None):
+    """Every value recorded for a country, snapshot after snapshot (a snapshot only has a row when the
+    country was parsed). With a year: only the estimates for that year"""
+    conditions = ["h.country_name = :country_name"]
+    if source is not None:
+        conditions.append("h.source = :source")
+    if year is not None:
+        conditions.append("h.year = :year")
+    sql = f"""SELECT h.snapshot_id, s.started_at, h.source, h.year, h.gdp, h.population, h.gdp_per_capita
+              FROM countries_gdp_history AS h
+              JOIN snapshots AS s ON s.snapshot_id = h.snapshot_id
+              WHERE {" AND ".join(conditions)}
+              ORDER BY h.source, h.snapshot_id"""
+    return sql, {"country_name": country_name, "source": source, "year": year}
+
+
+def snapshots(con):
+    return fetch(con, *snapshots_query())
+
+
+def top(con, region, n=10, source="IMF", snapshot_id=None, year=None):
+    return fetch(con, *top_query(region, n, source, snapshot_id, year))
+
+
+def delta(con, from_snapshot, to_snapshot, source=None, region=None):
+    return fetch(con, *delta_query(from_snapshot, to_snapshot, source, region))
+
+
+def series(con, country_name, source=None, year=None):
+    return fetch(con, *series_query(country_name, source, year))
+
+
+def print_rows(rows, out=None):
+    out = out or sys.stdout  # looked up when called: a redirected sys.stdout (contextlib.redirect_stdout) is used
+    if not rows:
+        print("(no rows)", file=out)
+        return
+    names = list(rows[0])
+    print("\t".join(names), file=out)
+    for row in rows:
+        print("\t".join("" if row[name] is None else str(row[name]) for name in names), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m countries_gdp.history", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=db.DEFAULT_DB_PATH, help="default: %(default)s")
+    parser.add_argument("--explain", action="store_true", help="print the query plan instead of the rows")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("snapshots", help="list the snapshots")
+
+    top_parser = commands.add_parser("top", help="top N GDPs of a region")
+    top_parser.add_argument("region")
+    top_parser.add_argument("-n", type=int, default=10)
+    top_parser.add_argument("--source", default="IMF")
+    top_parser.add_argument("--snapshot", type=int, help="default: the latest one")
+    top_parser.add_argument("--year", type=int)
+
+    delta_parser = commands.add_parser("delta", help="GDP changes between 2 snapshots")
+    delta_parser.add_argument("from_snapshot", type=int)
+    delta_parser.add_argument("to_snapshot", type=int)
+    delta_parser.add_argument("--source")
+    delta_parser.add_argument("--region")
+
+    series_parser = commands.add_parser("series", help="values of a country over the snapshots")
+    series_parser.add_argument("country_name")
+    series_parser.add_argument("--source")
+    series_parser.add_argument("--year", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "snapshots":
+        sql, params = snapshots_query()
+    elif args.command == "top":
+        sql, params = top_query(args.region, args.n, args.source, args.snapshot, args.year)
+    elif args.command == "delta":
+        sql, params = delta_query(args.from_snapshot, args.to_snapshot, args.source, args.region)
+    else:
+        sql, params = series_query(args.country_name, args.source, args.year)
+
+    con = db.connect(args.db)
+    try:
+        db.create_history_tables(con)  # a db written without SQLITE_HISTORY_ENABLED: empty results, not an error
+        if args.explain:
+            print("\n".join(explain(con, sql, params)))
+        else:
+            print_rows(fetch(con, sql, params))
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
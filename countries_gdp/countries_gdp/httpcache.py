@@ -0,0 +1,100 @@
+"""HTTP cache for the hourly crawls: revalidate with ETag/Last-Modified, keep the responses compressed in SQLite.
+
+Enabled in settings.py:
+    HTTPCACHE_POLICY = "countries_gdp.httpcache.RevalidatingPolicy"
+    HTTPCACHE_STORAGE = "countries_gdp.httpcache.SqliteCacheStorage"
+
+How a crawl goes once the page is in the cache:
+    1. the request is sent with If-None-Match/If-Modified-Since (the cached ETag/Last-Modified), never served from the
+       cache without asking (the page changes whenever someone edits it, max-age means nothing for us)
+    2. unchanged page: wikipedia answers 304 Not Modified (no body), scrapy's HttpCacheMiddleware hands the cached
+       response to the spider, flagged "not_modified" by the policy
+    3. GdpSpider.parse sees the flag and stops right there (GDP_SKIP_UNCHANGED): no parsing, no items, no pipelines.
+       Only if the rows parsed from that same body are in SQLITE_DB_PATH (parsed_pages, see db.py) and there's no
+       feed: the cache knows the page, not where the last crawl wrote it
+    changed page: a normal 200, cached again, parsed as usual
+"""
+import json
+import logging
+import time
+import zlib
+
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED = "not_modified"  # flag of a cached response confirmed by a 304
+
+CREATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS httpcache
+        (fingerprint BLOB PRIMARY KEY,
+        url TEXT,
+        status INTEGER,
+        headers BLOB,
+        body BLOB,
+        stored_at REAL)"""
+
+
+class RevalidatingPolicy(RFC2616Policy):
+    def is_cached_response_fresh(self, cachedresponse, request):
+        # never fresh: always ask the server, but with the validators so an unchanged page costs a 304
+        if b"ETag" in cachedresponse.headers:
+            request.headers[b"If-None-Match"] = cachedresponse.headers[b"ETag"]
+        if b"Last-Modified" in cachedresponse.headers:
+            request.headers[b"If-Modified-Since"] = cachedresponse.headers[b"Last-Modified"]
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        valid = super().is_cached_response_valid(cachedresponse, response, request)
+        if valid and response.status == 304:
+            cachedresponse.flags.append(NOT_MODIFIED)
+        return valid
+
+
+class SqliteCacheStorage:
+    # one row per request fingerprint, headers (json) and body zlib-compressed
+    # HTTPCACHE_SQLITE_PATH: the db file (default: httpcache.db, next to countries_gdp.db)
+    # HTTPCACHE_EXPIRATION_SECS: entries older than that are ignored (0: never expire)
+    # HTTPCACHE_SQLITE_COMPRESSION: zlib level, 1 (fast) - 9 (small)
+    def __init__(self, settings):
+        self.path = settings.get("HTTPCACHE_SQLITE_PATH", "httpcache.db")
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.compression = settings.getint("HTTPCACHE_SQLITE_COMPRESSION", 6)
+        self.con = None
+        self.fingerprinter = None
+
+    def open_spider(self, spider):
+        self.con = db.connect(self.path)
+        self.con.execute(CREATE_TABLE_SQL)
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug("Using SQLite cache storage in %(path)s", {"path": self.path}, extra={"spider": spider})
+
+    def close_spider(self, spider):
+        self.con.close()
+
+    def retrieve_response(self, spider, request):
+        row = self.con.execute("SELECT url, status, headers, body, stored_at FROM httpcache WHERE fingerprint = ?",
+                               (self.fingerprinter.fingerprint(request),)).fetchone()
+        if row is None:
+            return None  # not cached
+        url, status, headers, body, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None  # expired
+
+        request.meta["cache_timestamp"] = stored_at
+        headers = Headers({k.encode("latin-1"): [v.encode("latin-1") for v in values]
+                           for k, values in json.loads(zlib.decompress(headers)).items()})
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, status=status, headers=headers, body=body)
+
+    def store_response(self, spider, request, response):
+        headers = {k.decode("latin-1"): [v.decode("latin-1") for v in values] for k, values in response.headers.items()}
+        self.con.execute("INSERT OR REPLACE INTO httpcache (fingerprint, url, status, headers, body, stored_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (self.fingerprinter.fingerprint(request), response.url, response.status,
+                          zlib.compress(json.dumps(headers).encode("latin-1"), self.compression),
+                          zlib.compress(response.body, self.compression), time.time()))
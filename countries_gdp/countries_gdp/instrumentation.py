@@ -0,0 +1,147 @@
+"""Timings shared by the middlewares and the pipelines.
+
+Every crawler gets one Instrumentation object (see for_crawler) holding histograms, i.e.:
+    download_latency_ms (downloader middleware), response_size_bytes (downloader middleware),
+    parse_ms (spider middleware), pipeline/<PipelineClass>_ms (the @timed decorator on process_item)
+
+The histograms have fixed buckets (like Prometheus ones): observing a value is a couple of additions, whatever the
+number of values, so they are cheap enough to stay on for a whole crawl. When the spider closes they are published in
+the scrapy stats as timing/<name>/count, avg, p50, p95, max (the percentiles are the upper bound of their bucket).
+
+Also counters (inc: i.e. pipeline/<PipelineClass>/passed|dropped, published as is in the stats) and gauges (a
+function read when the metrics are exported, i.e. the depth of AsyncSaveToDatabasePipeline's queue), both exported
+live with the histograms by extensions.MetricsExporter.
+"""
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from weakref import WeakKeyDictionary
+
+from scrapy import signals
+from scrapy.exceptions import DropItem
+
+MS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1_000, 5_000, 10_000, 60_000)
+BYTES_BUCKETS = tuple(2 ** n for n in range(10, 27, 2))  # 1KiB ... 64MiB
+
+_instrumentations = WeakKeyDictionary()
+
+
+class Histogram:
+    def __init__(self, buckets=MS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one: above the largest bucket (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def publish(self, stats, prefix):
+        stats.set_value(f"{prefix}/count", self.count)
+        if self.count:
+            stats.set_value(f"{prefix}/avg", round(self.sum / self.count, 3))
+            stats.set_value(f"{prefix}/p50", round(self.percentile(0.50), 3))
+            stats.set_value(f"{prefix}/p95", round(self.percentile(0.95), 3))
+            stats.set_value(f"{prefix}/max", round(self.max, 3))
+
+
+class Instrumentation:
+    def __init__(self, crawler):
+        self.stats = crawler.stats
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    def histogram(self, name, buckets=MS_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(buckets)
+        return histogram
+
+    def observe(self, name, value, buckets=MS_BUCKETS):
+        self.histogram(name, buckets).observe(value)
+
+    def inc(self, name, count=1):
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def gauge(self, name, read):
+        # read: function without arguments returning the current value
+        self.gauges[name] = read
+
+    def spider_closed(self, spider):
+        for name, histogram in self.histograms.items():
+            histogram.publish(self.stats, f"timing/{name}")
+        for name, count in self.counters.items():
+            self.stats.set_value(name, count)
+
+
+def for_crawler(crawler):
+    """The crawler's Instrumentation, created on first use"""
+    instrumentation = _instrumentations.get(crawler)
+    if instrumentation is None:
+        instrumentation = _instrumentations[crawler] = Instrumentation(crawler)
+    return instrumentation
+
+
+def timed(process_item):
+    """Decorator for a pipeline's process_item: time spent in it -> pipeline/<PipelineClass>_ms histogram, and the
+    items it let through or dropped -> pipeline/<PipelineClass>/passed|dropped counters.
+    Dropped items (DropItem) are timed too. Works for sync and async (coroutine) process_item"""
+
+    def observe(pipeline, spider, start, outcome):
+        crawler = getattr(spider, "crawler", None)  # a spider created without a crawler (benchmarks): nothing to do
+        if crawler is not None:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            name = type(pipeline).__name__
+            instrumentation = for_crawler(crawler)
+            instrumentation.observe(f"pipeline/{name}_ms", elapsed_ms)
+            instrumentation.inc(f"pipeline/{name}/{outcome}")
+
+    if inspect.iscoroutinefunction(process_item):
+        @functools.wraps(process_item)
+        async def wrapper(self, item, spider):
+            start = time.perf_counter()
+            outcome = "failed"  # an exception that isn't a DropItem
+            try:
+                result = await process_item(self, item, spider)
+                outcome = "passed"
+                return result
+            except DropItem:
+                outcome = "dropped"
+                raise
+            finally:
+                observe(self, spider, start, outcome)
+    else:
+        @functools.wraps(process_item)
+        def wrapper(self, item, spider):
+            start = time.perf_counter()
+            outcome = "failed"
+            try:
+                result = process_item(self, item, spider)
+                outcome = "passed"
+                return result
+            except DropItem:
+                outcome = "dropped"
+                raise
+            finally:
+                observe(self, spider, start, outcome)
+
+    return wrapper
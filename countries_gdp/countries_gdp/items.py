@@ -12,10 +12,10 @@ Useful:
 
 """
 import re
+from dataclasses import dataclass, field
 
 import scrapy
 from itemloaders.processors import TakeFirst, MapCompose
-from w3lib.html import remove_tags
 
 """ Definitions:
 
@@ -30,41 +30,80 @@ Item vs ItemLoader:
     Item: structure
     ItemLoader: process of loading data into the item 
     
-w3lib.html.remove_tags: 
+strip_tags (same as w3lib.html.remove_tags + str.strip): 
     <a>some text</a> -> "some text"
+parse_gdp / parse_year: the whole cell -> number in one go (tags, footnotes, commas, "—" for missing values)
+    a processor returning None drops the value: MapCompose doesn't keep it, the field stays unset
     
 """
 
 
-def remove_commas(value):
-    return value.replace(",", "")
-
-
-def try_int(value):
-    # some counties don't have a gdp. gdp is a non-digit str
-    try:
-        return int(value)
-    # so if you get an error converting it to a float
-    except ValueError:
-        # then return the initial value
+# Precompiled once at import, the processors below run for every cell of every row
+TAGS = re.compile(r"<[^>]*>")
+# one sub() drops the tags, the footnotes (<sup>[n 1]</sup>, [1], ...) and their text: "26,854,599<sup>[n 1]</sup>"
+MARKUP = re.compile(r"<sup\b[^>]*>.*?</sup>|<[^>]*>|\[[^\]]*\]", re.S)
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")  # 26,854,599 | 1,234.5
+YEAR = re.compile(r"(?<![\d,.])\d{4}(?![\d,.])")  # 4 digits, not part of a number like 26854599 or 107,352
+# what the table shows when a source has no value
+MISSING = frozenset({"", "—", "–", "-", "N/A", "n/a"})
+
+
+def strip_tags(value):
+    # remove_tags + str.strip, but cells that are plain text (no "<") skip the regex
+    if "<" in value:
+        value = TAGS.sub("", value)
+    return value.strip()
+
+
+def clean_cell(value):
+    # text of a numeric cell: no tags, no footnotes
+    if "<" in value or "[" in value:
+        value = MARKUP.sub("", value)
+    return value.strip()
+
+
+def parse_gdp(value):
+    """ "<td>26,854,599<sup>[n 1]</sup></td>" -> 26854599.0 | "—" -> None (no value: the field isn't set)
+    anything else that isn't a number is returned as is (text), CountriesGdpPipeline drops it """
+    value = clean_cell(value)
+    if value in MISSING:
+        return None
+    if NUMBER.fullmatch(value):
+        return float(value.replace(",", ""))
+    return value
+
+
+def parse_year(value):
+    """ "<td>[n 1]2023</td>" -> 2023 | "—" -> None | no year in the cell -> the text as is """
+    value = clean_cell(value)
+    if value in MISSING:
+        return None
+    year = YEAR.search(value)
+    if year is None:
         return value
+    return int(year.group())
 
 
-def try_float(value):
-    try:
-        return float(value)
-    except ValueError:
+def parse_count(value):
+    """ "334,914,895<sup>[8]</sup> (<a>3rd</a>)" -> 334914895 (first number of the cell) | "—" -> None """
+    value = clean_cell(value)
+    if value in MISSING:
+        return None
+    number = NUMBER.search(value)
+    if number is None:
         return value
+    return int(float(number.group().replace(",", "")))
 
 
-def extract_year(value):
-    year = re.findall(r"\d{4}", value)  # 4 consecutive digits
-
-    # don't assume success (value = "-" -> year: falsey/none/"")
-    if not year:
+def parse_amount(value):
+    """ "$80,412<sup>[9]</sup> (7th)" -> 80412.0 (first number of the cell, currency signs ignored) | "—" -> None """
+    value = clean_cell(value)
+    if value in MISSING:
+        return None
+    number = NUMBER.search(value)
+    if number is None:
         return value
-
-    return year
+    return float(number.group().replace(",", ""))
 
 
 class CountriesGdpItem(scrapy.Item):
@@ -72,18 +111,73 @@ class CountriesGdpItem(scrapy.Item):
     country_name = scrapy.Field(
         # Formalization of the transition from selector to value that's assigned to a field
         # creating instances ofMapCompose and TakeFirst
-        input_processor=MapCompose(remove_tags, str.strip),  # what comes in
+        input_processor=MapCompose(strip_tags),  # what comes in
         output_processor=TakeFirst()  # what comes out | TakeFirst() will extract the 1st val from a list of vals
     )
     region = scrapy.Field(
-        input_processor=MapCompose(remove_tags, str.strip),
+        input_processor=MapCompose(strip_tags),
         output_processor=TakeFirst()
     )
     gdp = scrapy.Field(
-        input_processor=MapCompose(remove_tags, str.strip, remove_commas, try_float),
+        input_processor=MapCompose(parse_gdp),
         output_processor=TakeFirst()
     )
     year = scrapy.Field(
-        input_processor=MapCompose(remove_tags, str.strip, extract_year, try_int),
+        input_processor=MapCompose(parse_year),
+        output_processor=TakeFirst()
+    )
+    # which estimate of the table the gdp/year come from: "IMF", "World Bank" or "UN"
+    source = scrapy.Field(
+        input_processor=MapCompose(str.strip),
         output_processor=TakeFirst()
     )
+    # from the country's article (infobox), only when the spider follows the country links (GDP_FOLLOW_COUNTRIES)
+    population = scrapy.Field(
+        input_processor=MapCompose(parse_count),
+        output_processor=TakeFirst()
+    )
+    gdp_per_capita = scrapy.Field(
+        input_processor=MapCompose(parse_amount),
+        output_processor=TakeFirst()
+    )
+
+
+class CountriesGdpRevisionItem(CountriesGdpItem):
+    # same fields, read from a past revision of the page (gdp_revisions spider), set as they are: no processors
+    revision_id = scrapy.Field()
+    revision_timestamp = scrapy.Field()
+
+
+""" Records: the lightweight alternative to the scrapy.Item classes above, for very large crawls (i.e. the revision
+backfill, millions of rows)
+
+    scrapy crawl gdp -a item_type=record             (or GDP_ITEM_TYPE = "record" in settings.py)
+    scrapy crawl gdp_revisions -a item_type=record
+
+A scrapy.Item is an object + a dict of its values, and the ItemLoader that fills it builds a list of values per field
+before TakeFirst keeps the first one. A record is a dataclass with __slots__: its values are stored in the object
+itself (no dict), and it's built in one call by the extractors (extractors.py, streaming.py, wikitext.py: pass the
+record class where an item class goes) which parse one value at a time, no list per field.
+
+itemadapter supports dataclasses: the pipelines and the feed exporters work with records unchanged. One difference:
+a record has all its fields, the ones without value are None (null in the json feeds) instead of not set.
+
+"parse" (metadata of the field): the function the item's MapCompose runs, applied to one raw value
+"""
+
+
+@dataclass(slots=True)
+class CountriesGdpRecord:
+    country_name: str = field(default=None, metadata={"parse": strip_tags})
+    region: str = field(default=None, metadata={"parse": strip_tags})
+    gdp: float = field(default=None, metadata={"parse": parse_gdp})
+    year: int = field(default=None, metadata={"parse": parse_year})
+    source: str = field(default=None, metadata={"parse": str.strip})
+    population: int = field(default=None, metadata={"parse": parse_count})
+    gdp_per_capita: float = field(default=None, metadata={"parse": parse_amount})
+
+
+@dataclass(slots=True)
+class CountriesGdpRevisionRecord(CountriesGdpRecord):
+    revision_id: int = None
+    revision_timestamp: str = None
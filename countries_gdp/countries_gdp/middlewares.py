@@ -3,22 +3,38 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import cProfile
+import time
+
 from scrapy import signals
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from . import instrumentation
+from .paths import optional_path
+
 
 class CountriesGdpSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
     # scrapy acts as if the spider middleware does not modify the
     # passed objects.
 
+    # Instrumentation: time spent in the spider callback (parse) per response -> timing/parse_ms in the stats
+    # PROFILE_OUTPUT = "gdp.prof" in settings.py: the whole crawl runs under cProfile and the stats are dumped there
+    #   when the spider closes (python -m pstats gdp.prof, or snakeviz gdp.prof)
+
+    def __init__(self, instrumentation=None, profile_output=None):
+        self.instrumentation = instrumentation
+        self.profile_output = profile_output
+        self.profiler = None
+
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(instrumentation.for_crawler(crawler), optional_path(crawler.settings, "PROFILE_OUTPUT"))
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
     def process_spider_input(self, response, spider):
@@ -33,8 +49,27 @@ class CountriesGdpSpiderMiddleware:
         # it has processed the response.
 
         # Must return an iterable of Request, or item objects.
+        # parse is a generator: its work happens while we iterate, the time spent downstream (between our yields)
+        # isn't counted
+        parse_seconds = 0.0
+        start = time.perf_counter()
         for i in result:
+            parse_seconds += time.perf_counter() - start
+            yield i
+            start = time.perf_counter()
+        parse_seconds += time.perf_counter() - start
+        self.instrumentation.observe("parse_ms", parse_seconds * 1000)
+
+    async def process_spider_output_async(self, response, result, spider):
+        # Same as process_spider_output, for async callbacks / async middlewares
+        parse_seconds = 0.0
+        start = time.perf_counter()
+        async for i in result:
+            parse_seconds += time.perf_counter() - start
             yield i
+            start = time.perf_counter()
+        parse_seconds += time.perf_counter() - start
+        self.instrumentation.observe("parse_ms", parse_seconds * 1000)
 
     def process_spider_exception(self, response, exception, spider):
         # Called when a spider or process_spider_input() method
@@ -54,6 +89,16 @@ class CountriesGdpSpiderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+        if self.profile_output:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def spider_closed(self, spider):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_output)
+            spider.logger.info("cProfile stats written to %s" % self.profile_output)
+            self.profiler = None
 
 
 class CountriesGdpDownloaderMiddleware:
@@ -61,10 +106,18 @@ class CountriesGdpDownloaderMiddleware:
     # scrapy acts as if the downloader middleware does not modify the
     # passed objects.
 
+    # Instrumentation: download latency and response size per response
+    #   -> timing/download_latency_ms and timing/response_size_bytes in the stats
+    # and the responses per status -> responses/<status> (live in extensions.MetricsExporter, i.e. 429s/503s when a
+    # backfill slows down)
+
+    def __init__(self, instrumentation=None):
+        self.instrumentation = instrumentation
+
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(instrumentation.for_crawler(crawler))
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
@@ -87,6 +140,13 @@ class CountriesGdpDownloaderMiddleware:
         # - return a Response object
         # - return a Request object
         # - or raise IgnoreRequest
+
+        # download_latency: set by scrapy's downloader (time from sending the request to getting the headers back)
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.instrumentation.observe("download_latency_ms", latency * 1000)
+        self.instrumentation.observe("response_size_bytes", len(response.body), instrumentation.BYTES_BUCKETS)
+        self.instrumentation.inc(f"responses/{response.status}")
         return response
 
     def process_exception(self, request, exception, spider):
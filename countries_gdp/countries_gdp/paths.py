@@ -0,0 +1,17 @@
+"""Optional file settings (VALIDATION_REJECTS_PATH, CHANGE_DETECTION_DIFF_PATH, METRICS_SNAPSHOT_PATH, PROFILE_OUTPUT,
+DEDUPE_BLOOM_PATH): None in settings.py turns the file off.
+
+On the command line every -s value is a str: "-s CHANGE_DETECTION_DIFF_PATH=None" is the str "None", which would
+create a file named None in the current directory. optional_path reads the setting and turns "", "None" and "none"
+into None, every reader of these settings goes through it.
+"""
+
+DISABLED = frozenset({"", "None", "none"})
+
+
+def optional_path(settings, name, default=None):
+    """The path of the setting `name`, None when it's off"""
+    value = settings.get(name, default)
+    if value is None or (isinstance(value, str) and value.strip() in DISABLED):
+        return None
+    return value
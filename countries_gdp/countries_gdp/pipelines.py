@@ -6,8 +6,24 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
-from scrapy.exceptions import DropItem
-import sqlite3
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.defer import DeferredSemaphore
+from twisted.internet.threads import deferToThread
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from . import changes, db, dedupe, validation
+from .paths import optional_path
+from .signals import page_parsed, revision_parsed
+from .instrumentation import for_crawler, timed
+
+logger = logging.getLogger(__name__)
 
 """ Why is a Pipeline?
 # Pipeline's class method call order: __init__, open_spider, process_item (called n-times), close_spider
@@ -33,58 +49,541 @@ Pipeline: Python class that implements a method process_item,
 """
 
 
+""" Drop reasons:
+    the pipelines raise subclasses of DropItem, scrapy counts the dropped items by exception class name in the stats:
+        item_dropped_reasons_count/InvalidGdp, item_dropped_reasons_count/InvalidItem,
+        item_dropped_reasons_count/DuplicateCountry,
+        item_dropped_reasons_count/UnchangedCountry
+    the time spent in each process_item is in the stats too (@timed): timing/pipeline/<PipelineClass>_ms/...
+"""
+
+
+class InvalidItem(DropItem):
+    pass
+
+
+class InvalidGdp(InvalidItem):
+    # the most common rejection (a missing estimate, "—" in the table): its own drop reason in the stats
+    pass
+
+
+class DuplicateCountry(DropItem):
+    pass
+
+
+class UnchangedCountry(DropItem):
+    def __init__(self, message):
+        # most items of a re-crawl are unchanged: one log line each at the default WARNING level would drown the log
+        super().__init__(message, log_level="DEBUG")
+
+
 class CountriesGdpPipeline:
+    # checks every item against validation.SCHEMA (types, ranges, regions, year bounds), compiled once in __init__
+    # VALIDATION_REJECTS_PATH: the rejected rows are appended to this JSON lines file (None: not written), one line each:
+    #   {"rejected_at": ..., "spider": ..., "errors": ["year: expected int, got str ('n/a')", ...], "item": {...}}
+    # stats: validation/items, validation/rejected, validation/time_us_total, validation/avg_us_per_item
+    def __init__(self, schema=validation.SCHEMA, rejects_path=None, stats=None):
+        self.validator = validation.Validator(schema)
+        self.rejects_path = rejects_path
+        self.stats = stats
+        self.rejects_file = None
+        self.items = 0
+        self.rejected = 0
+        self.elapsed_ns = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(rejects_path=optional_path(crawler.settings, "VALIDATION_REJECTS_PATH"), stats=crawler.stats)
+
+    @timed
     def process_item(self, item, spider):
-        if not isinstance(item["gdp"], float):
+        start = time.perf_counter_ns()
+        # the adapter reads the fields of the item in place, nothing is copied for a valid item
+        adapter = ItemAdapter(item)
+        errors = self.validator.errors(adapter)
+        self.elapsed_ns += time.perf_counter_ns() - start
+        self.items += 1
+        if errors:
+            self.rejected += 1
+            self._write_reject(spider, adapter, errors)
             # item will NOT be processed further
-            raise DropItem("Missing GDP value. Item excluded. ")  # scrapy specific exception
+            # only the estimate is wrong (gdp, with its year): InvalidGdp, anything else about the row: InvalidItem
+            exception = InvalidGdp if all(error.startswith(("gdp:", "year:")) for error in errors) else InvalidItem
+            raise exception(f"Invalid item, excluded: {'; '.join(errors)}")  # scrapy specific exception
 
         return item
 
+    def close_spider(self, spider):
+        if self.rejects_file is not None:
+            self.rejects_file.close()
+        if self.stats is not None:
+            self.stats.set_value("validation/items", self.items)
+            self.stats.set_value("validation/rejected", self.rejected)
+            self.stats.set_value("validation/time_us_total", round(self.elapsed_ns / 1000, 1))
+            if self.items:
+                self.stats.set_value("validation/avg_us_per_item", round(self.elapsed_ns / 1000 / self.items, 3))
+
+    def _write_reject(self, spider, adapter, errors):
+        if not self.rejects_path:
+            return
+        if self.rejects_file is None:
+            # opened on the first rejection: a crawl without any doesn't leave an empty file behind
+            self.rejects_file = open(self.rejects_path, "a", encoding="utf-8")
+        rejected_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        record = {"rejected_at": rejected_at, "spider": spider.name, "errors": errors, "item": adapter.asdict()}
+        self.rejects_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
 
 class SaveToDatabasePipeline:
     # This will export a sqlite db that you can access it. I used DBeaver to access it
-    def __init__(self):
+    # Items are buffered and written in batches: one transaction (executemany + a single commit) per batch instead of
+    # a commit (an fsync) per item. A batch is flushed when it reaches SQLITE_BATCH_SIZE items, when
+    # SQLITE_FLUSH_INTERVAL seconds went by since the last flush, and one last time in close_spider
+    # SQLITE_WRITE_MODE: "upsert" (default) updates the countries that are already in the table when their values
+    # changed, "insert" is the plain INSERT that fails on a country that's already in the table
+    # SQLITE_HISTORY_ENABLED: the crawl is also recorded as a snapshot, its rows appended to countries_gdp_history
+    # (see db.py and history.py for the queries)
+    # The content hashes of the rows (ChangeDetectionPipeline, changes.py) are written with them, same transaction
+    # A parsed page (page_parsed signal) is recorded in parsed_pages with the last batch of its rows, once every item
+    # came through (spider_idle): GdpSpider only skips an unchanged page whose rows are in this db (GDP_SKIP_UNCHANGED)
+    def __init__(self, db_path=db.DEFAULT_DB_PATH, batch_size=500, flush_interval=5.0, write_mode="upsert",
+                 journal_mode="WAL", synchronous="NORMAL", cache_size=-20000, history=False, stats=None,
+                 instrumentation=None):
         # if you would like to use a cloud db you'd have to make changes here in the initialization stages
-        self.con = sqlite3.connect("countries_gdp.db")  # SQLite: connect-to-db if sql-db-exists else create-db
-        self.cur = self.con.cursor()  # pointer to the db that allows you to run queries
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if write_mode not in db.WRITE_MODES:
+            raise ValueError(f"Unknown SQLITE_WRITE_MODE {write_mode!r}, expected one of {sorted(db.WRITE_MODES)}")
+        self.write_sql = db.WRITE_MODES[write_mode]
+        self.pragmas = {"journal_mode": journal_mode, "synchronous": synchronous, "cache_size": cache_size}
+        self.history = history
+        self.stats = stats
+        self.instrumentation = instrumentation  # flush latency histogram: sqlite_flush_ms (live in extensions.py)
+        self.con = None
+        self.scraped_at = None
+        self.snapshot_id = None
+        self.buffer = []
+        self.parsed_pages = []  # (url, fingerprint, parsed_at): parsed, their items still on the way
+        self.pages = []  # every item of these pages is in the buffer: written with it
+        self.last_flush = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # settings.py -> pipeline, same pattern as the middlewares' from_crawler
+        settings = crawler.settings
+        pipeline = cls(
+            db_path=settings.get("SQLITE_DB_PATH", db.DEFAULT_DB_PATH),
+            batch_size=settings.getint("SQLITE_BATCH_SIZE", 500),
+            flush_interval=settings.getfloat("SQLITE_FLUSH_INTERVAL", 5.0),
+            write_mode=settings.get("SQLITE_WRITE_MODE", "upsert"),
+            journal_mode=settings.get("SQLITE_JOURNAL_MODE", "WAL"),
+            synchronous=settings.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+            cache_size=settings.getint("SQLITE_CACHE_SIZE", -20000),
+            history=settings.getbool("SQLITE_HISTORY_ENABLED", False),
+            stats=crawler.stats,
+            instrumentation=for_crawler(crawler),
+        )
+        crawler.signals.connect(pipeline.page_parsed, signal=page_parsed)
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
 
     def open_spider(self, spider):
         # called when the spider is open which is when the spider starts scraping
         # make sure the table exists/created here, so you don't have to check in the methods i.e. process_item
-        # SQL query to create a table
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS countries_gdp 
-        (country_name TEXT PRIMARY KEY,
-        region TEXT,
-        gdp REAL,
-        year INTEGER)""")
-
-        self.con.commit()
+        self.con = db.connect(self.db_path, **self.pragmas)  # SQLite: connect-to-db if sql-db-exists else create-db
+        db.create_table(self.con)
+        # one timestamp per crawl: every row written (inserted or changed) by this crawl gets the same scraped_at
+        self.scraped_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if self.history:
+            db.create_history_tables(self.con)
+            self.snapshot_id = db.start_snapshot(self.con, spider.name, self.scraped_at)
+            if self.stats is not None:
+                self.stats.set_value("sqlite/snapshot_id", self.snapshot_id)
+        self.last_flush = time.monotonic()
 
+    @timed
     def process_item(self, item, spider):
-        # to help prevent sql injection attacks it's better to NOT set the VALUES manually
-
-        # IMPORTANT: if the countries_gdp.db file exists and already contains countries then adding an existing
-        # country will result in a dupe(exception) since the primary key is the country name.
-        # So, if you run "scrapy crawl gdp -O gdp.json" the exception will cause the gdp.json to be empty
-        self.con.execute("""INSERT INTO countries_gdp (country_name, region, gdp, year) 
-                            VALUES (?, ?, ?, ?)""",
-                         (item["country_name"], item["region"], item["gdp"], item["year"]))
-        self.con.commit()
+        # to help prevent sql injection attacks it's better to NOT set the VALUES manually (see db.INSERT_SQL)
+
+        # IMPORTANT: with SQLITE_WRITE_MODE = "insert", if the countries_gdp.db file exists and already contains
+        # countries then adding an existing country will result in a dupe(exception) since the primary key is the
+        # (country name, source). So, if you run "scrapy crawl gdp -O gdp.json" the exception will cause the gdp.json to be empty
+        # "upsert" (the default) doesn't have this problem: existing countries are updated, and only if they changed
+        self.buffer.append(db.item_to_row(item, self.scraped_at))
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
         return item
 
-    def close_spider(self):
-        # after the scraping is done close the connection
-        self.con.close()
+    def page_parsed(self, url, fingerprint):
+        self.parsed_pages.append((url, fingerprint, datetime.now(timezone.utc).isoformat(timespec="seconds")))
+
+    def spider_idle(self, spider):
+        # nothing left in the scraper: every item of the parsed pages went through process_item (or was dropped)
+        self.pages += self.parsed_pages
+        self.parsed_pages = []
+        self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer and not self.pages:
+            return
+
+        rows, self.buffer = self.buffer, []
+        pages, self.pages = self.pages, []
+        start = time.perf_counter()
+        changed = db.write_rows(self.con, rows, self.write_sql, self.snapshot_id, content_hashes=True, pages=pages)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        if self.stats is not None:
+            self.stats.inc_value("sqlite/flushes")
+            self.stats.inc_value("sqlite/rows_flushed", len(rows))
+            self.stats.inc_value("sqlite/rows_changed", changed)
+            self.stats.inc_value("sqlite/flush_latency_ms_total", latency_ms)
+            self.stats.max_value("sqlite/flush_latency_ms_max", latency_ms)
+        if self.instrumentation is not None:
+            self.instrumentation.observe("sqlite_flush_ms", latency_ms)
+
+    def close_spider(self, spider):
+        # after the scraping is done write what's left in the buffer and close the connection
+        try:
+            self.flush()
+            if self.snapshot_id is not None:
+                db.finish_snapshot(self.con, self.snapshot_id, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        finally:
+            self.con.close()
+
+
+class AsyncSaveToDatabasePipeline(SaveToDatabasePipeline):
+    # Same writes as SaveToDatabasePipeline (batches, upsert, pragmas, stats) but the sqlite3 calls don't run on the
+    # reactor thread: process_item only puts the row on a queue and a dedicated writer thread owns the connection,
+    # so downloads and parsing keep going while a batch is being committed
+    # The rows waiting to be written are bounded (SQLITE_QUEUE_SIZE, queued or in the writer's unflushed batch): if
+    # the writer falls behind, process_item waits until there's room again -> backpressure instead of unbounded memory
+    # growth. The wait is a Deferred on the reactor side (DeferredSemaphore, one token per row, given back by the
+    # writer through reactor.callFromThread after each flush): no thread of the reactor's pool is parked on a full
+    # queue, the pool stays free for the DNS resolver and the other deferToThread calls
+    # A batch is at most SQLITE_QUEUE_SIZE rows: the rows of the unflushed batch hold their slots, a bigger batch would
+    # never fill up and every slot-full of rows would wait for SQLITE_FLUSH_INTERVAL
+    _STOP = object()  # sentinel: no more rows, flush and exit
+    _PAGES = object()  # (_PAGES, pages): spider_idle, the rows of these pages are all queued before it
+
+    def __init__(self, *args, queue_size=10_000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queue = queue.Queue()  # unbounded: the slots below are the bound
+        self.writer = None
+        self.writer_error = None
+        self.set_queue_size(queue_size)
+
+    def set_queue_size(self, queue_size):
+        self.slots = DeferredSemaphore(queue_size)
+        if self.batch_size > queue_size:
+            logger.warning(f"SQLITE_BATCH_SIZE {self.batch_size} > SQLITE_QUEUE_SIZE {queue_size}: batches of "
+                           f"{queue_size} rows")
+            self.batch_size = queue_size
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super().from_crawler(crawler)
+        pipeline.set_queue_size(crawler.settings.getint("SQLITE_QUEUE_SIZE", 10_000))
+        # rows waiting for the writer thread, read live by the metrics exporter: a growing queue = the db is the stall
+        pipeline.instrumentation.gauge("sqlite_queue_depth", pipeline.queue.qsize)
+        return pipeline
+
+    def open_spider(self, spider):
+        opened = threading.Event()
+        self.writer = threading.Thread(target=self._write_loop, args=(spider, opened), name="sqlite-writer",
+                                       daemon=True)
+        self.writer.start()
+        # a Deferred: scrapy waits for the writer to have connected/created the table without blocking the reactor
+        return deferToThread(self._wait_opened, opened)
+
+    def _wait_opened(self, opened):
+        opened.wait()
+        self._raise_writer_error()
+
+    @timed
+    async def process_item(self, item, spider):
+        self._raise_writer_error()
+        row = db.item_to_row(item, self.scraped_at)
+        # backpressure: a free slot right away, or a Deferred fired when the writer gives slots back. The reactor
+        # keeps fetching and parsing meanwhile
+        await maybe_deferred_to_future(self.slots.acquire())
+        self._raise_writer_error()  # the writer may have failed while we waited (see _release_waiters)
+        self.queue.put_nowait(row)
+
+        if self.stats is not None:
+            self.stats.max_value("sqlite/queue_size_max", self.queue.qsize())
+        return item
+
+    def spider_idle(self, spider):
+        # the pages go through the queue, behind their rows: the writer writes them with the last ones
+        if self.parsed_pages:
+            self.queue.put_nowait((self._PAGES, self.parsed_pages))
+            self.parsed_pages = []
+
+    def close_spider(self, spider):
+        # drain: the writer writes everything that's still queued, flushes and closes the connection before we return
+        return deferToThread(self._drain)
+
+    def _drain(self):
+        self.queue.put(self._STOP)
+        self.writer.join()
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        if self.writer_error is not None:
+            raise RuntimeError("SQLite writer thread failed") from self.writer_error
+
+    def _give_back(self, rows):
+        # writer thread -> reactor thread: the rows are written, their slots are free again
+        if rows:
+            from twisted.internet import reactor
+            reactor.callFromThread(self._release_slots, rows)
+
+    def _release_slots(self, rows):
+        for _ in range(rows):
+            self.slots.release()
+
+    def _release_waiters(self):
+        # the writer is gone: wake up every process_item waiting for a slot, they raise the writer's error
+        while self.slots.waiting:
+            self.slots.release()
+
+    def _write_loop(self, spider, opened):
+        # everything below runs in the writer thread: the connection is created, used and closed here only
+        try:
+            super().open_spider(spider)
+        except Exception as e:
+            self.writer_error = e
+            return
+        finally:
+            opened.set()
+
+        try:
+            while True:
+                # wake up at least every flush_interval, so a half-full batch isn't held back when items stop coming
+                timeout = max(self.flush_interval - (time.monotonic() - self.last_flush), 0.01)
+                try:
+                    row = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._flush_and_give_back()
+                    continue
+
+                if row is self._STOP:
+                    break
+                if row[0] is self._PAGES:
+                    self.pages += row[1]
+                    self._flush_and_give_back()
+                    continue
+                self.buffer.append(row)
+                if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                    self._flush_and_give_back()
+        except Exception as e:
+            self.writer_error = e
+            from twisted.internet import reactor
+            reactor.callFromThread(self._release_waiters)
+            # keep consuming so _drain doesn't hang
+            while self.queue.get() is not self._STOP:
+                pass
+        finally:
+            try:
+                super().close_spider(spider)
+            except Exception as e:
+                self.writer_error = self.writer_error or e
+
+    def _flush_and_give_back(self):
+        rows = len(self.buffer)
+        self.flush()
+        self._give_back(rows)
 
 
 class NoDuplicateCountryPipeline:
-    def __init__(self):
-        self.countries_seen = set()
+    # a country comes once per source (IMF, World Bank, UN): a duplicate is the same country for the same source
+    # the key (DEDUPE_KEY_FIELDS) and where the seen keys are kept (DEDUPE_BACKEND) are configurable: see dedupe.py
+    def __init__(self, backend=None, key_fields=("country_name", "source"), stats=None):
+        self.backend = backend if backend is not None else dedupe.MemorySetBackend()
+        self.key_fields = tuple(key_fields)
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            backend=dedupe.build_backend(settings),
+            key_fields=settings.getlist("DEDUPE_KEY_FIELDS", ["country_name", "source"]),
+            stats=crawler.stats,
+        )
 
+    def open_spider(self, spider):
+        self.backend.open()
+
+    @timed
     def process_item(self, item, spider):
-        if item["country_name"] in self.countries_seen:
-            raise DropItem(f"Duplicate Country found: {item}")
+        adapter = ItemAdapter(item)
+        key = tuple(adapter.get(field) for field in self.key_fields)
+        if not self.backend.add(key):
+            raise DuplicateCountry(f"Duplicate Country found: {item}")
         else:
-            self.countries_seen.add(item["country_name"])
             return item
+
+    def close_spider(self, spider):
+        if self.stats is not None:
+            for name, value in self.backend.stats().items():
+                self.stats.set_value(f"dedupe/{name}", value)
+        self.backend.close()
+
+
+class ChangeDetectionPipeline:
+    # only the rows that changed since the last crawl go further (SaveToDatabasePipeline, the feeds): the others are
+    # dropped (UnchangedCountry), so a re-crawl writes O(changes) rows instead of the whole table
+    # the content hash of every (country_name, source) is kept in the content_hashes table of SQLITE_DB_PATH and
+    # written by SaveToDatabasePipeline with the rows (see changes.py): a crawl into another db file compares with
+    # that file's rows, and rows that were never written (failed batch, db pipeline off) aren't "unchanged" next time
+    # CHANGE_DETECTION_DIFF_PATH: the changes are also appended to this JSON lines file, one line per row:
+    #   {"change": "added" | "changed", "crawled_at": ..., <the item's fields>}
+    #   {"change": "removed", "crawled_at": ..., "country_name": ..., "source": ...}
+    # "removed": the country/source was there last time and not in this crawl. Only when the crawl finished normally
+    # (an interrupted crawl didn't see every row) and saw at least one row (a page skipped as unchanged,
+    # GDP_SKIP_UNCHANGED, yields nothing: nothing was removed)
+    def __init__(self, store=None, diff_path="changes.jsonl", stats=None):
+        self.store = store if store is not None else changes.ContentHashStore()  # db.DEFAULT_DB_PATH
+        self.diff_path = diff_path
+        self.stats = stats
+        self.diff_file = None
+        self.seen = set()
+        self.crawled_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("CHANGE_DETECTION_ENABLED"):
+            raise NotConfigured("CHANGE_DETECTION_ENABLED is off")
+        pipeline = cls(
+            store=changes.ContentHashStore(settings.get("SQLITE_DB_PATH", db.DEFAULT_DB_PATH)),
+            diff_path=optional_path(settings, "CHANGE_DETECTION_DIFF_PATH", "changes.jsonl"),
+            stats=crawler.stats,
+        )
+        # the removed rows are forgotten on spider_closed and not in close_spider: only the signal has the close
+        # reason
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.store.open()
+        self.crawled_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if self.diff_path:
+            self.diff_file = open(self.diff_path, "a", encoding="utf-8")
+
+    @timed
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        key = (adapter.get("country_name"), adapter.get("source"))
+        self.seen.add(key)
+        change = self.store.check(key, changes.content_hash(item))
+        if change is None:
+            self._inc_stat("changes/unchanged")
+            raise UnchangedCountry(f"Unchanged since the last crawl: {key}")
+
+        self._inc_stat(f"changes/{change}")
+        self._write_diff({"change": change, "crawled_at": self.crawled_at, **adapter.asdict()})
+        return item
+
+    def spider_closed(self, spider, reason):
+        try:
+            removed = []
+            if reason == "finished" and self.seen:
+                removed = sorted(key for key in self.store.hashes if key not in self.seen)
+                for country_name, source in removed:
+                    self._write_diff({"change": "removed", "crawled_at": self.crawled_at,
+                                      "country_name": country_name, "source": source})
+                self._inc_stat("changes/removed", len(removed))
+            self.store.forget(removed)
+        finally:
+            if self.diff_file is not None:
+                self.diff_file.close()
+            self.store.close()
+
+    def _write_diff(self, record):
+        if self.diff_file is not None:
+            self.diff_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _inc_stat(self, name, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(name, count)
+
+
+class SaveRevisionsPipeline:
+    # gdp_revisions spider: the items of a revision are written with the revision's checkpoint, in one transaction,
+    # once every item of the revision came out of the pipelines (written here, or dropped/failed before: counted
+    # with the item_dropped/item_error signals). The spider announces how many items a revision has with the
+    # revision_parsed signal (see signals.py), a revision without items is checkpointed right away.
+    # Killed run: the revisions not complete yet aren't in the db, the next run fetches them again, and only them
+    def __init__(self, db_path=db.DEFAULT_DB_PATH, stats=None):
+        self.db_path = db_path
+        self.stats = stats
+        self.con = None
+        self.revisions = {}  # revision_id -> revision, until it's written
+        self.expected = {}  # revision_id -> number of items the spider yields for it
+        self.done = {}  # revision_id -> items out of the pipelines so far
+        self.rows = {}  # revision_id -> rows to write
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(db_path=crawler.settings.get("SQLITE_DB_PATH", db.DEFAULT_DB_PATH), stats=crawler.stats)
+        crawler.signals.connect(pipeline.revision_parsed, signal=revision_parsed)
+        crawler.signals.connect(pipeline.item_left, signal=signals.item_dropped)
+        crawler.signals.connect(pipeline.item_left, signal=signals.item_error)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.con = db.connect(self.db_path)
+        db.create_revision_tables(self.con)
+
+    def revision_parsed(self, revision, items):
+        revision_id = revision["revision_id"]
+        self.revisions[revision_id] = revision
+        self.expected[revision_id] = items
+        self.done.setdefault(revision_id, 0)
+        self.rows.setdefault(revision_id, [])
+        self._write_if_complete(revision_id)
+
+    @timed
+    def process_item(self, item, spider):
+        revision_id = ItemAdapter(item).get("revision_id")
+        self.rows.setdefault(revision_id, []).append(db.item_to_row(item))
+        self._item_done(revision_id)
+        return item
+
+    def item_left(self, item, spider, **kwargs):
+        # dropped (InvalidGdp, DuplicateCountry) or failed in a pipeline before this one: done for its revision too
+        revision_id = ItemAdapter(item).get("revision_id")
+        if revision_id in self.done:
+            self._item_done(revision_id)
+
+    def _item_done(self, revision_id):
+        self.done[revision_id] = self.done.get(revision_id, 0) + 1
+        self._write_if_complete(revision_id)
+
+    def _write_if_complete(self, revision_id):
+        if revision_id not in self.expected or self.done[revision_id] < self.expected[revision_id]:
+            return
+        # forgotten before the write: if it fails, the item that completed the revision gets an item_error and
+        # item_left mustn't count it a second time. The revision isn't checkpointed, the next run fetches it again
+        revision, rows = self.revisions.pop(revision_id), self.rows.pop(revision_id)
+        del self.expected[revision_id], self.done[revision_id]
+        try:
+            db.write_revision(self.con, revision, rows, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        except Exception:
+            if self.stats is not None:
+                self.stats.inc_value("revisions/failed")
+            raise
+        if self.stats is not None:
+            self.stats.inc_value("revisions/written")
+            self.stats.inc_value("revisions/rows_written", len(rows))
+
+    def close_spider(self, spider):
+        if self.stats is not None and self.expected:
+            # closed before all their items came through (i.e. shutdown): not checkpointed, fetched again next run
+            self.stats.set_value("revisions/incomplete", len(self.expected))
+        self.con.close()
@@ -0,0 +1,185 @@
+"""Crawl many wikitable list pages at once: the pages are sharded over a pool of processes, one CrawlerProcess each.
+
+    python -m countries_gdp.runner URL [URL ...] [--processes 4] [--db countries_gdp.db] [-s NAME=VALUE ...]
+    python -m countries_gdp.runner --urls pages.txt          (one url per line)
+
+i.e.
+    python -m countries_gdp.runner https://en.wikipedia.org/wiki/List_of_countries_by_GDP_(PPP) \\
+        https://en.wikipedia.org/wiki/List_of_countries_by_GDP_(nominal)_per_capita
+    python -m countries_gdp.runner file://$PWD/fixtures/gdp_nominal.html     (local pages, or python fixtures/serve.py)
+
+The pages have to be laid out like the GDP (nominal) list (country | region | 3 sources of estimates, see
+extractors.py), GdpSpider parses them.
+
+Why processes: parsing (lxml + the ItemLoader processors) holds the GIL, one Twisted process parses on one core
+whatever CONCURRENT_REQUESTS is. Each worker crawls its shard of pages (one crawler per page, concurrently) and
+writes the items to a JSON lines feed per page, the database pipelines are disabled in the workers. The parent
+process is the only one writing to the SQLite db: it merges the feeds of a shard as soon as the shard is done, one
+table per page (named after the page, i.e. countries_by_gdp_ppp), while the other shards are still crawling.
+Several processes writing to the same SQLite file would only wait on each other's locks.
+
+With as many pages as processes (or more) and pages of about the same size, it scales with the number of cores until
+the network (or the site's rate limits: AutoThrottle is per process) becomes the bottleneck.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from . import db
+
+SETTINGS_MODULE = "countries_gdp.settings"
+# the workers write feeds, the parent writes the db
+WORKER_DISABLED_PIPELINES = ("SaveToDatabasePipeline", "AsyncSaveToDatabasePipeline", "ChangeDetectionPipeline")
+WORKER_STATS = ("item_scraped_count", "item_dropped_count", "finish_reason", "elapsed_time_seconds")
+
+
+def page_slug(url):
+    """Table name for a page: List_of_countries_by_GDP_(PPP) -> countries_by_gdp_ppp, gdp_nominal.html -> gdp_nominal"""
+    name = Path(unquote(urlparse(url).path)).stem or urlparse(url).hostname or "page"
+    slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+    slug = slug.removeprefix("list_of_") or "page"
+    return slug if not slug[0].isdigit() else f"page_{slug}"
+
+
+def shard_pages(pages, processes):
+    """Round robin: [(slug, url), ...] -> at most `processes` lists of pages"""
+    shards = [pages[i::processes] for i in range(processes)]
+    return [shard for shard in shards if shard]
+
+
+def crawl_shard(task):
+    """Runs in a worker process: crawl every page of the shard in one CrawlerProcess, 1 JSON lines feed per page"""
+    pages, feed_dir, overrides = task
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", SETTINGS_MODULE)
+    # imported here: the parent process never starts a reactor
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    from .spiders.gdp import GdpSpider
+
+    settings = get_project_settings()
+    # several crawlers per worker and several workers: they can't all listen on METRICS_PORT (-s to turn it back on)
+    settings.set("METRICS_ENABLED", False, priority="project")
+    settings.setdict(overrides, priority="cmdline")
+    pipelines = settings.getdict("ITEM_PIPELINES")
+    for path in list(pipelines):
+        if path.rsplit(".", 1)[-1] in WORKER_DISABLED_PIPELINES:
+            pipelines[path] = None
+    settings.set("ITEM_PIPELINES", pipelines, priority="cmdline")
+    # %(page)s: the spider's "page" attribute (the -a page=... below), one feed file per page
+    settings.set("FEEDS", {str(Path(feed_dir) / "%(page)s.jsonl"): {"format": "jsonlines", "overwrite": True}},
+                 priority="cmdline")
+
+    process = CrawlerProcess(settings)
+    crawlers = {}
+    for slug, url in pages:
+        crawler = crawlers[slug] = process.create_crawler(GdpSpider)
+        process.crawl(crawler, start_url=url, page=slug)
+    process.start()
+
+    return [{"page": slug, "url": url, "feed": str(Path(feed_dir) / f"{slug}.jsonl"),
+             "stats": {name: crawlers[slug].stats.get_value(name) for name in WORKER_STATS}}
+            for slug, url in pages]
+
+
+def merge_feed(con, feed, table, write_mode="upsert", batch_size=500, scraped_at=None):
+    """Write the items of a worker's feed to `table`, batch_size rows per transaction. Returns the rows changed"""
+    db.create_table(con, table)
+    sql = db.write_sql(write_mode, table)
+    content_hashes = table == db.DEFAULT_TABLE  # same as SaveToDatabasePipeline, for ChangeDetectionPipeline
+    changed = 0
+    batch = []
+    if not os.path.exists(feed):  # the page failed before its first item
+        return changed
+    with open(feed, encoding="utf-8") as f:
+        for line in f:
+            batch.append(db.item_to_row(json.loads(line), scraped_at))
+            if len(batch) >= batch_size:
+                changed += db.write_rows(con, batch, sql, content_hashes=content_hashes)
+                batch = []
+    if batch:
+        changed += db.write_rows(con, batch, sql, content_hashes=content_hashes)
+    return changed
+
+
+def run(urls, processes=None, db_path=db.DEFAULT_DB_PATH, overrides=None, write_mode="upsert", batch_size=500):
+    """Crawl the urls with `processes` workers, merge everything into db_path. Returns one summary dict per page"""
+    pages = []
+    for url in urls:
+        slug = page_slug(url)
+        if slug in dict(pages):
+            raise ValueError(f"2 pages would write to the same table {slug!r}: {url}")
+        pages.append((slug, url))
+    processes = max(1, min(processes or os.cpu_count() or 1, len(pages)))
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", SETTINGS_MODULE)  # inherited by the workers
+
+    summaries = []
+    scraped_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    con = db.connect(db_path)
+    try:
+        with tempfile.TemporaryDirectory(prefix="countries_gdp_feeds_") as feed_dir:
+            tasks = [(shard, feed_dir, dict(overrides or {})) for shard in shard_pages(pages, processes)]
+            # spawn: fresh interpreters (a forked Twisted reactor isn't safe), maxtasksperchild=1: a reactor can't be
+            # restarted, one shard per process
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(processes, maxtasksperchild=1) as pool:
+                for results in pool.imap_unordered(crawl_shard, tasks):
+                    for result in results:
+                        start = time.perf_counter()
+                        result["rows_changed"] = merge_feed(con, result["feed"], result["page"], write_mode,
+                                                            batch_size, scraped_at)
+                        result["merge_seconds"] = round(time.perf_counter() - start, 3)
+                        summaries.append(result)
+    finally:
+        con.close()
+    return summaries
+
+
+def parse_overrides(values):
+    overrides = {}
+    for value in values:
+        name, sep, setting = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"-s {value}: expected NAME=VALUE")
+        overrides[name] = setting
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m countries_gdp.runner", description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("--urls", dest="urls_file", help="file with one url per line")
+    parser.add_argument("--processes", type=int, help="default: number of cores (never more than the pages)")
+    parser.add_argument("--db", default=db.DEFAULT_DB_PATH, help="default: %(default)s")
+    parser.add_argument("-s", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+                        help="setting for the workers, like scrapy crawl -s")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, encoding="utf-8") as f:
+            urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not urls:
+        parser.error("no url to crawl")
+    overrides = parse_overrides(args.settings)
+
+    start = time.perf_counter()
+    summaries = run(urls, args.processes, args.db, overrides,
+                    write_mode=overrides.get("SQLITE_WRITE_MODE", "upsert"),
+                    batch_size=int(overrides.get("SQLITE_BATCH_SIZE", 500)))
+    for summary in sorted(summaries, key=lambda s: s["page"]):
+        stats = summary["stats"]
+        print(f"{summary['page']}: {stats['item_scraped_count'] or 0} items, {summary['rows_changed']} rows changed, "
+              f"finish_reason={stats['finish_reason']} ({summary['url']})")
+    print(f"{len(summaries)} pages in {time.perf_counter() - start:.1f}s -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,18 +16,31 @@ NEWSPIDER_MODULE = "countries_gdp.spiders"
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = "countries_gdp (+http://www.yourdomain.com)"
 
+# How GdpSpider.parse extracts the rows: "loader" (ItemLoader per row), "compiled" (see extractors.py) or
+# "streaming" (see streaming.py: no DOM, flat memory on very large pages)
+# can be overridden per run with: scrapy crawl gdp -a extraction_mode=compiled
+GDP_EXTRACTION_MODE = "loader"
+# What the spiders yield: "item" (CountriesGdpItem, a scrapy.Item) or "record" (CountriesGdpRecord, a slotted
+# dataclass: less memory and no per-field lists, for very large crawls; see items.py)
+# can be overridden per run with: scrapy crawl gdp -a item_type=record
+GDP_ITEM_TYPE = "item"
+# Follow every country's article to add population and gdp_per_capita to its items (1 extra request per country)
+# can be overridden per run with: scrapy crawl gdp -a follow_countries=true
+GDP_FOLLOW_COUNTRIES = False
+
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
+# the country articles (GDP_FOLLOW_COUNTRIES) are fetched concurrently, AutoThrottle (below) keeps it polite
+CONCURRENT_REQUESTS = 16
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
 #DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
 #CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -44,21 +57,38 @@ ROBOTSTXT_OBEY = True
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    "countries_gdp.middlewares.CountriesGdpSpiderMiddleware": 543,
-#}
+# CountriesGdpSpiderMiddleware: parse time per response (+ optional cProfile dump, see PROFILE_OUTPUT)
+SPIDER_MIDDLEWARES = {
+    "countries_gdp.middlewares.CountriesGdpSpiderMiddleware": 543,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "countries_gdp.middlewares.CountriesGdpDownloaderMiddleware": 543,
-#}
+# CountriesGdpDownloaderMiddleware: download latency and response size per response
+DOWNLOADER_MIDDLEWARES = {
+    "countries_gdp.middlewares.CountriesGdpDownloaderMiddleware": 543,
+}
+
+# cProfile the whole crawl and dump the stats to this file when the spider closes (None: no profiling)
+# i.e. scrapy crawl gdp -s PROFILE_OUTPUT=gdp.prof, then: python -m pstats gdp.prof
+PROFILE_OUTPUT = None
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 #}
+# live metrics of the crawl (requests in flight, latencies, items per pipeline, db flushes, queue depths) in the
+# Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics, see extensions.py
+EXTENSIONS = {
+    "countries_gdp.extensions.MetricsExporter": 500,
+}
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"  # local only
+METRICS_PORT = 9410  # 0: no endpoint (snapshots only)
+# the metrics appended as JSON lines to this file every METRICS_SNAPSHOT_INTERVAL seconds (None: no snapshots)
+METRICS_SNAPSHOT_PATH = None
+METRICS_SNAPSHOT_INTERVAL = 30.0
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -67,32 +97,86 @@ ITEM_PIPELINES = {
     # 0 - 1000 is the range for the order # i.e. the 100, 300
     "countries_gdp.pipelines.CountriesGdpPipeline": 100,  # data validation
     "countries_gdp.pipelines.NoDuplicateCountryPipeline": 200,  # remove duplicate countries
-    "countries_gdp.pipelines.SaveToDatabasePipeline": 300  # add data to DB
+    # drop the rows that didn't change since the last crawl, write the diff feed (CHANGE_DETECTION_ENABLED)
+    "countries_gdp.pipelines.ChangeDetectionPipeline": 250,
+    # add data to DB, the sqlite3 calls run in a writer thread (keeps them off the reactor/event-loop thread)
+    # "countries_gdp.pipelines.SaveToDatabasePipeline" does the same writes synchronously on the reactor thread
+    "countries_gdp.pipelines.AsyncSaveToDatabasePipeline": 300
 
 }
 
+# SaveToDatabasePipeline: items are buffered and written with executemany in a single transaction per batch
+# a batch is flushed every SQLITE_BATCH_SIZE items or SQLITE_FLUSH_INTERVAL seconds (+ a final flush on close)
+SQLITE_DB_PATH = "countries_gdp.db"
+SQLITE_BATCH_SIZE = 500
+SQLITE_FLUSH_INTERVAL = 5.0  # seconds
+# "upsert": re-crawls update the countries whose region/gdp/year changed (and their scraped_at), the others are skipped
+# "insert": plain INSERT, a country that's already in countries_gdp.db raises IntegrityError
+SQLITE_WRITE_MODE = "upsert"
+# AsyncSaveToDatabasePipeline: max rows waiting for the writer thread, when full process_item waits (backpressure)
+# also the max batch size of that pipeline (a smaller SQLITE_QUEUE_SIZE caps SQLITE_BATCH_SIZE)
+SQLITE_QUEUE_SIZE = 10000
+# See https://www.sqlite.org/pragma.html
+SQLITE_JOURNAL_MODE = "WAL"
+SQLITE_SYNCHRONOUS = "NORMAL"  # safe with WAL, commits no longer fsync (only checkpoints do)
+SQLITE_CACHE_SIZE = -20000  # negative: KiB (~20MB), positive: number of pages
+# every crawl is also recorded as a snapshot: rows appended to countries_gdp_history, which countries_gdp (latest
+# values only) doesn't keep. Queries over the snapshots: python -m countries_gdp.history --help
+SQLITE_HISTORY_ENABLED = True
+
+# CountriesGdpPipeline: the items are checked against validation.SCHEMA, the rejected ones (and why) are appended as
+# JSON lines to VALIDATION_REJECTS_PATH (None: only the log and the item_dropped_reasons_count stats)
+VALIDATION_REJECTS_PATH = "rejects.jsonl"
+
+# NoDuplicateCountryPipeline: what makes 2 items duplicates and where the seen keys are kept (see dedupe.py)
+# "memory" (exact set, one crawl) | "hashed" (64-bit fingerprints, one crawl) | "bloom" | "sqlite" (across runs)
+DEDUPE_BACKEND = "memory"
+DEDUPE_KEY_FIELDS = ["country_name", "source"]  # i.e. ["country_name", "source", "year"] for history crawls
+DEDUPE_SQLITE_PATH = "dedupe.db"
+DEDUPE_BLOOM_CAPACITY = 1000000
+DEDUPE_BLOOM_ERROR_RATE = 0.01
+DEDUPE_BLOOM_PATH = None  # i.e. "dedupe.bloom": the filter is saved when the spider closes and reused by the next run
+
+# ChangeDetectionPipeline: only the added/changed rows reach the database and the feeds (-s CHANGE_DETECTION_ENABLED=False
+# for a full feed). Content hashes in the content_hashes table of SQLITE_DB_PATH, written with the rows, the changes
+# (added/changed/removed) appended as JSON lines to CHANGE_DETECTION_DIFF_PATH (None: no diff feed)
+CHANGE_DETECTION_ENABLED = True
+CHANGE_DETECTION_DIFF_PATH = "changes.jsonl"
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-#AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = True
 # The initial download delay
-#AUTOTHROTTLE_START_DELAY = 5
+AUTOTHROTTLE_START_DELAY = 1
 # The maximum download delay to be set in case of high latencies
 #AUTOTHROTTLE_MAX_DELAY = 60
 # The average number of requests Scrapy should be sending in parallel to
 # each remote server
-#AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 4.0
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
+# countries_gdp/httpcache.py: every request is revalidated (ETag/Last-Modified), a 304 means the page didn't change
+# and GdpSpider skips parsing it (GDP_SKIP_UNCHANGED). Responses are kept zlib-compressed in httpcache.db
+HTTPCACHE_ENABLED = True
+HTTPCACHE_EXPIRATION_SECS = 0
 #HTTPCACHE_DIR = "httpcache"
 #HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_POLICY = "countries_gdp.httpcache.RevalidatingPolicy"
+HTTPCACHE_STORAGE = "countries_gdp.httpcache.SqliteCacheStorage"
+HTTPCACHE_SQLITE_PATH = "httpcache.db"
+HTTPCACHE_SQLITE_COMPRESSION = 6  # zlib level: 1 (fast) - 9 (small)
+# unchanged page (304) whose rows are in SQLITE_DB_PATH (parsed_pages table), no feed: don't parse it, no items
+# scrapy crawl gdp -a skip_unchanged=false to parse it anyway
+GDP_SKIP_UNCHANGED = True
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
+# scrapy crawl gdp -O gdp.parquet: typed, columnar, written in row groups (see exporters.py, needs pyarrow)
+FEED_EXPORTERS = {
+    "parquet": "countries_gdp.exporters.ParquetItemExporter",
+}
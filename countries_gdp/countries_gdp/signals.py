@@ -0,0 +1,10 @@
+"""Signals of the project, sent with crawler.signals.send_catch_log like scrapy's own (scrapy.signals)"""
+
+# the gdp_revisions spider parsed a revision and is about to yield its items
+# args: revision ({"revision_id", "parent_id", "timestamp"}), items (how many items it yields, 0 included)
+revision_parsed = object()
+
+# GdpSpider parsed a page (not skipped as unchanged) and is about to yield its items
+# args: url, fingerprint (db.body_fingerprint of the body). The db pipelines record it (parsed_pages) with the rows
+# once every item is through (spider_idle): the next 304 of that page can then be skipped
+page_parsed = object()
@@ -1,5 +1,13 @@
+from urllib.parse import urlparse
+
 import scrapy
-from ..items import CountriesGdpItem
+from .. import db
+from ..extractors import SOURCE_COLUMNS, extract_countries, spread_colspans
+from ..httpcache import NOT_MODIFIED
+from ..items import CountriesGdpItem, CountriesGdpRecord
+from ..signals import page_parsed
+from ..streaming import stream_response
+from itemadapter import ItemAdapter
 from scrapy.loader import ItemLoader
 
 """ to create a scrapy project exec: "scrapy startproject project_name"
@@ -19,11 +27,95 @@ class GdpSpider(scrapy.Spider):
     allowed_domains = ["wikipedia.org"]
     # what scrapy will call when the spider gets executed
     start_urls = ["https://en.wikipedia.org/wiki/List_of_countries_by_GDP_(nominal)"]
+    # "loader": the ItemLoader loop below | "compiled": extractors.py, same items, one pass over the table
+    # "streaming": streaming.py, same items, rows read while the html is parsed (no DOM: for very large pages)
+    # spider arg: "scrapy crawl gdp -a extraction_mode=compiled", otherwise GDP_EXTRACTION_MODE from settings.py
+    extraction_mode = None
+    # "item": CountriesGdpItem (scrapy.Item) | "record": CountriesGdpRecord, the slotted dataclass of items.py, lighter
+    # for very large crawls (with "loader" the rows are read the "compiled" way: the ItemLoader is what it avoids)
+    # spider arg: "scrapy crawl gdp -a item_type=record", otherwise GDP_ITEM_TYPE from settings.py
+    item_type = None
+    # follow every country's article to add population and gdp_per_capita to its items
+    # spider arg: "scrapy crawl gdp -a follow_countries=true", otherwise GDP_FOLLOW_COUNTRIES from settings.py
+    # the country requests run concurrently: CONCURRENT_REQUESTS(_PER_DOMAIN) / AutoThrottle in settings.py
+    follow_countries = None
+    # page answered with 304 Not Modified (see httpcache.py): skip parsing, nothing changed since the last crawl
+    # only if its rows are in SQLITE_DB_PATH (parsed_pages, see db.py) and there's no feed (-o/-O) to fill
+    # spider arg: "scrapy crawl gdp -a skip_unchanged=false" to parse it anyway, otherwise GDP_SKIP_UNCHANGED
+    skip_unchanged = None
+
+    def __init__(self, start_url=None, *args, **kwargs):
+        # -a start_url=...: crawl a local copy instead, i.e. http://127.0.0.1:8000/gdp_nominal.html (python fixtures/serve.py)
+        super().__init__(*args, **kwargs)
+        if start_url:
+            self.start_urls = [start_url]
+            host = urlparse(start_url).hostname
+            if host:
+                self.allowed_domains = [host]
+
+    def option(self, name, setting, default):
+        # spider arg (-a name=value, always a str) > settings.py > default
+        value = getattr(self, name)
+        if value is None:
+            settings = getattr(self, "settings", None)  # a spider created without a crawler (benchmarks) has none
+            return settings.get(setting, default) if settings is not None else default
+        return value
+
+    def flag(self, name, setting, default):
+        # option() for true/false options: "-a follow_countries=true" is the str "true"
+        return str(self.option(name, setting, default)).lower() in ("1", "true", "yes")
 
     # after start_url http req is complete, the res will be passed in the response arg, parse will be auto-called
     def parse(self, response):
         """Specify all the steps & extraction paths using css/xpath that we want to extract from the page. The main part
-        of the spider is something you've done without the framework i.e. extract, parse HTML from doc obj"""
+        of the spider is something you've done without the framework i.e. extract, parse HTML from doc obj
+
+        Every row of the table gives 1 item per source of estimates (IMF, World Bank, UN), tagged with item["source"]
+        """
+        fingerprint = db.body_fingerprint(response.body)
+        if NOT_MODIFIED in response.flags and self.flag("skip_unchanged", "GDP_SKIP_UNCHANGED", True) \
+                and self.rows_in_db(response.url, fingerprint):
+            # same page as the cached one, and its items are in the db: no need to parse or to go through the pipelines
+            self.logger.info(f"Page not modified since the last crawl, skipped: {response.url}")
+            self.crawler.stats.inc_value("gdp/unchanged_pages_skipped")
+            return
+        if getattr(self, "crawler", None) is not None:  # a spider created without a crawler (benchmarks) has none
+            self.crawler.signals.send_catch_log(page_parsed, url=response.url, fingerprint=fingerprint)
+
+        extraction_mode = self.option("extraction_mode", "GDP_EXTRACTION_MODE", "loader")
+        item_cls = self.item_class()
+        if extraction_mode == "compiled" or (extraction_mode == "loader" and item_cls is not CountriesGdpItem):
+            countries = extract_countries(response, item_cls)
+        elif extraction_mode == "streaming":
+            countries = stream_response(response, item_cls)
+        else:
+            countries = self.load_countries(response)
+
+        follow = self.flag("follow_countries", "GDP_FOLLOW_COUNTRIES", False)
+        for country_href, items in countries:
+            if follow and country_href:
+                # the items wait for the country's article: parse_country adds population/gdp_per_capita to them
+                # if the article can't be fetched, country_failed yields them as they are
+                yield response.follow(country_href, callback=self.parse_country, errback=self.country_failed,
+                                      cb_kwargs={"items": items})
+            else:
+                yield from items
+
+    def rows_in_db(self, url, fingerprint):
+        # the 304 says the page is the one in the http cache, not that its rows are where this crawl writes them
+        if self.settings.getdict("FEEDS"):
+            return False  # -o/-O: the feed is empty unless the page is parsed
+        con = db.connect(self.settings.get("SQLITE_DB_PATH", db.DEFAULT_DB_PATH))
+        try:
+            return db.parsed_page_fingerprint(con, url) == fingerprint
+        finally:
+            con.close()
+
+    def item_class(self, item_cls=CountriesGdpItem, record_cls=CountriesGdpRecord):
+        return record_cls if self.option("item_type", "GDP_ITEM_TYPE", "item") == "record" else item_cls
+
+    def load_countries(self, response):
+        """The ItemLoader way: yields (country article href, [one item per source]) for every row"""
 
         # visually/functionally looks like selectolax lib, but it's not
         for country in response.css("table.wikitable.sortable tbody tr:not([class])"):  # not([attr]): elem without attr
@@ -32,16 +124,22 @@ class GdpSpider(scrapy.Spider):
             #   everything can be done in this method, but it's better to have separation of concerns
             # order of executions seems to be:
             #   scrapy crawl gdp -O gdp.json -> yield the item (here) -> item-loaders -> pipeline post-processing
-            item = ItemLoader(item=CountriesGdpItem(), selector=country)
 
+            # cells -> table columns: a source without estimate is 1 cell <td colspan="2">—</td> for 2 columns
+            columns = spread_colspans(country.xpath("./*"), lambda cell: cell.attrib.get("colspan"))
+            items = []
+            for source, (gdp_position, year_position) in SOURCE_COLUMNS.items():
+                item = ItemLoader(item=CountriesGdpItem(), selector=country)
 
-            # don't need ::text or get() it gets taken care of in the ItemLoader processors
-            item.add_css("country_name", "td:nth-child(1) a")
-            item.add_css("region", "td:nth-child(2) a")
-            item.add_css("gdp", "td:nth-child(3)")
-            item.add_css("year", "td:nth-child(4)")
+                # don't need ::text or get() it gets taken care of in the ItemLoader processors
+                item.add_css("country_name", "td:nth-child(1) a")
+                item.add_css("region", "td:nth-child(2) a")
+                item.add_value("gdp", self.column_html(columns, gdp_position))
+                item.add_value("year", self.column_html(columns, year_position))
+                item.add_value("source", source)
+                items.append(item.load_item())
 
-            yield item.load_item()
+            yield country.css("td:nth-child(1) a::attr(href)").get(), items
 
             """ missing github 
             ... -> github xpath selectors(main part before the extra scrapy stuff used for maintainability/scaling) 
@@ -84,6 +182,43 @@ class GdpSpider(scrapy.Spider):
                     giving us output 1 item at a time compared to all at once at the end
             """
 
+    @staticmethod
+    def column_html(columns, position):
+        if len(columns) < position or columns[position - 1].root.tag != "td":
+            return None
+        return columns[position - 1].get()
+
+    def parse_country(self, response, items):
+        """Country article: population and GDP (nominal) per capita from the infobox, added to the country's items
+
+        infobox rows: a header row ("Population", "GDP (nominal)", ...) followed by its "• 2023 estimate",
+        "• Per capita", ... rows, so we remember which section we're in while going down the rows
+        """
+        country = ItemLoader(item=CountriesGdpItem())
+        section = None
+        for row in response.css("table.infobox tr"):
+            label = " ".join(row.css("th ::text").getall()).replace("\xa0", " ").strip()
+            data = row.css("td.infobox-data").get()
+            if not {"mergedrow", "mergedbottomrow"} & set((row.attrib.get("class") or "").split()):
+                # a new section starts (mergedtoprow) or a plain row
+                section = "population" if label.startswith("Population") else \
+                    "gdp_nominal" if label.startswith("GDP") and "nominal" in label else None
+
+            if section == "population" and data and not country.get_collected_values("population"):
+                country.add_value("population", data)
+            elif section == "gdp_nominal" and data and "Per capita" in label:
+                country.add_value("gdp_per_capita", data)
+
+        extra = country.load_item()
+        for item in items:
+            ItemAdapter(item).update(extra)  # ItemAdapter: items and records alike
+            yield item
+
+    def country_failed(self, failure):
+        # no article (404, timeout, ...): the GDP items are still good, yield them without the extra fields
+        self.logger.warning(f"Country article failed, items kept without enrichment: {failure.request.url}")
+        yield from failure.request.cb_kwargs["items"]
+
 
 """
 XPATH: query lang for XML & XML-like docs(HTML). It's an alt to the CSS(CSS > XPATH) approach you've used above.
@@ -0,0 +1,133 @@
+from urllib.parse import urlencode, urlparse
+
+import scrapy
+from itemadapter import ItemAdapter
+from .gdp import GdpSpider
+from .. import db
+from ..extractors import extract_countries
+from ..items import CountriesGdpRevisionItem, CountriesGdpRevisionRecord
+from ..signals import revision_parsed
+from ..wikitext import parse_countries
+
+""" Backfill: the GDP table as it was in every past revision of the list page -> countries_gdp_revisions table
+
+    scrapy crawl gdp_revisions                                        every revision of the page, newest first
+    scrapy crawl gdp_revisions -a since=2023-01-01 -a until=2023-12-31 -a limit=100
+    scrapy crawl gdp_revisions -a wiki=http://127.0.0.1:8000          the local stand-in (python fixtures/serve.py)
+    scrapy crawl gdp_revisions -a item_type=record                    lighter items (see the records in items.py)
+
+    1. the revisions are listed with the MediaWiki API (action=query&prop=revisions, 500 per request)
+    2. every revision is fetched as raw wikitext (index.php?oldid=...&action=raw, parsed by wikitext.py: a third of
+       the size of the html and no DOM), -a revision_format=html for the rendered page instead (extractors.py)
+    3. the revisions are fetched concurrently: politeness limits are scrapy's settings, CONCURRENT_REQUESTS_PER_DOMAIN
+       and AutoThrottle (custom_settings below, override with -s), maxlag=5 on the API requests
+    4. SaveRevisionsPipeline writes each revision with its checkpoint (revisions table) in one transaction
+
+    Resume: the revisions already in the db are skipped when the list comes back, a killed run refetches only the
+    revisions it hadn't finished writing. Works with or without JOBDIR (-s JOBDIR=crawls/revisions: the requests
+    still pending are restored too)
+"""
+
+
+class GdpRevisionsSpider(GdpSpider):
+    name = "gdp_revisions"
+    title = "List of countries by GDP (nominal)"
+    wiki = "https://en.wikipedia.org"
+    # -a since/until: ISO dates or timestamps, oldest/newest revision to fetch | -a limit: max number of revisions
+    since = None
+    until = None
+    limit = None
+    revision_format = "wikitext"  # or "html"
+    custom_settings = {
+        "ITEM_PIPELINES": {
+            "countries_gdp.pipelines.CountriesGdpPipeline": 100,
+            "countries_gdp.pipelines.NoDuplicateCountryPipeline": 200,
+            "countries_gdp.pipelines.SaveRevisionsPipeline": 300,
+        },
+        # a country comes once per source in each revision
+        "DEDUPE_KEY_FIELDS": ["revision_id", "country_name", "source"],
+        # a revision never changes: nothing to revalidate, and the db checkpoint already avoids refetching
+        "HTTPCACHE_ENABLED": False,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 4,
+        "AUTOTHROTTLE_ENABLED": True,
+        "AUTOTHROTTLE_TARGET_CONCURRENCY": 2.0,
+    }
+
+    def __init__(self, wiki=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if wiki:
+            self.wiki = wiki.rstrip("/")
+        self.allowed_domains = [urlparse(self.wiki).hostname]
+        self.done = set()
+        self.enumerated = 0
+
+    async def start(self):
+        # the checkpoints: what a previous run already wrote
+        con = db.connect(self.settings.get("SQLITE_DB_PATH", db.DEFAULT_DB_PATH))
+        try:
+            self.done = db.done_revisions(con)
+        finally:
+            con.close()
+        if self.done:
+            self.logger.info(f"{len(self.done)} revisions already in the db, they won't be fetched again")
+        yield self.revisions_request()
+
+    def revisions_request(self, rvcontinue=None):
+        params = {"action": "query", "prop": "revisions", "titles": self.title, "rvprop": "ids|timestamp",
+                  "rvlimit": 500, "format": "json", "formatversion": 2, "maxlag": 5}
+        if self.until:
+            params["rvstart"] = self.until  # newest first: the list starts at `until`...
+        if self.since:
+            params["rvend"] = self.since  # ...and ends at `since`
+        if rvcontinue:
+            params["rvcontinue"] = rvcontinue
+        # dont_filter: with JOBDIR, the list must be requested again on resume
+        return scrapy.Request(f"{self.wiki}/w/api.php?{urlencode(params)}", callback=self.parse_revisions,
+                              dont_filter=True)
+
+    def parse_revisions(self, response):
+        data = response.json()
+        if "error" in data:  # i.e. maxlag: the servers are lagging, retry later (AutoThrottle slows down meanwhile)
+            self.logger.warning(f"API error {data['error'].get('code')}: {data['error'].get('info')}")
+            yield response.request.replace(dont_filter=True)
+            return
+
+        limit = int(self.limit) if self.limit else None
+        for page in data["query"]["pages"]:
+            for revision in page.get("revisions", []):
+                if limit is not None and self.enumerated >= limit:
+                    return
+                self.enumerated += 1
+                self.crawler.stats.inc_value("revisions/enumerated")
+                if revision["revid"] in self.done:
+                    self.crawler.stats.inc_value("revisions/skipped")
+                    continue
+                yield self.revision_request({"revision_id": revision["revid"], "parent_id": revision.get("parentid"),
+                                             "timestamp": revision.get("timestamp")})
+
+        if "continue" in data:
+            yield self.revisions_request(data["continue"]["rvcontinue"])
+
+    def revision_request(self, revision):
+        params = {"oldid": revision["revision_id"]}
+        if self.revision_format != "html":
+            params["action"] = "raw"
+        return scrapy.Request(f"{self.wiki}/w/index.php?{urlencode(params)}", callback=self.parse_revision,
+                              cb_kwargs={"revision": revision})
+
+    def parse_revision(self, response, revision):
+        item_cls = self.item_class(CountriesGdpRevisionItem, CountriesGdpRevisionRecord)
+        if self.revision_format == "html":
+            countries = extract_countries(response, item_cls)
+        else:
+            countries = parse_countries(response.body.decode("utf-8"), item_cls)
+        items = [item for _, row_items in countries for item in row_items]
+        for item in items:
+            adapter = ItemAdapter(item)
+            adapter["revision_id"] = revision["revision_id"]
+            adapter["revision_timestamp"] = revision["timestamp"]
+
+        self.crawler.stats.inc_value("revisions/fetched")
+        # SaveRevisionsPipeline writes the revision once that many items came through (0: right away)
+        self.crawler.signals.send_catch_log(revision_parsed, revision=revision, items=len(items))
+        yield from items
@@ -0,0 +1,110 @@
+from pathlib import Path
+
+import scrapy
+from itemadapter import ItemAdapter
+from .gdp import GdpSpider
+from .gdp_revisions import GdpRevisionsSpider
+from .. import db
+from ..items import CountriesGdpRevisionItem, CountriesGdpRevisionRecord
+from ..signals import revision_parsed
+from ..wikitext import dump_revisions, open_dump, parse_items
+
+""" Sibling of GdpSpider reading the page's wikitext instead of the rendered html (see wikitext.py): same items.
+
+    scrapy crawl gdp_wikitext                                              the action=raw source of the live page
+    scrapy crawl gdp_wikitext -a source=fixtures/gdp_nominal.wikitext      a saved action=raw payload
+    scrapy crawl gdp_wikitext -a source=fixtures/gdp_nominal_dump.xml      a MediaWiki XML dump (.xml, .xml.bz2, .xml.gz)
+    scrapy crawl gdp_wikitext -a source=fixtures/gdp_nominal_dump.xml -a revisions=all
+    scrapy crawl gdp_wikitext -a item_type=record                          lighter items (see the records in items.py)
+
+    revisions=all: every revision of the dump -> countries_gdp_revisions table, like the gdp_revisions backfill (same
+    items with revision_id/revision_timestamp, same pipelines and dedupe key, same checkpoints: the revisions already
+    in the db are skipped)
+
+    the wikitext is ~1/3 of the size of the html and is parsed without a DOM: this is the cheap way to read many
+    revisions of the page (a dump of its history, Special:Export) or to run without network access
+"""
+
+DUMP_SUFFIXES = (".xml", ".xml.bz2", ".xml.gz")
+# revisions=all: the settings of gdp_revisions that make a revision's rows land in countries_gdp_revisions (and not
+# collapse into countries_gdp, the countries of every revision after the first dropped as duplicates/unchanged)
+ALL_REVISIONS_SETTINGS = {name: GdpRevisionsSpider.custom_settings[name]
+                          for name in ("ITEM_PIPELINES", "DEDUPE_KEY_FIELDS")}
+
+
+class GdpWikitextSpider(GdpSpider):
+    # a GdpSpider for its options (item_type / GDP_ITEM_TYPE: item_class), the html parsing isn't used
+    name = "gdp_wikitext"
+    allowed_domains = ["wikipedia.org"]
+    # the page, in the dumps: other pages of the dump are skipped
+    title = "List of countries by GDP (nominal)"
+    # -a source=...: local file (dump or wikitext) or url of the raw wikitext, default: action=raw of `title`
+    source = None
+    # dumps with the history of the page: "latest" only its last revision, "all" every revision, oldest first
+    revisions = "latest"
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # -a revisions=all is only known now: the settings can still be changed here (they're frozen after)
+        if spider.revisions == "all":
+            crawler.settings.setdict(ALL_REVISIONS_SETTINGS, priority="spider")
+        return spider
+
+    def raw_url(self):
+        return f"https://en.wikipedia.org/w/index.php?title={self.title.replace(' ', '_')}&action=raw"
+
+    async def start(self):
+        source = self.source or self.raw_url()
+        # dont_filter: like the start_urls requests, a local copy (file://, 127.0.0.1) isn't dropped as offsite
+        if "://" in source:
+            yield scrapy.Request(source, callback=self.parse, dont_filter=True)
+        elif source.endswith(DUMP_SUFFIXES):
+            # read from the disk directly (not through the downloader): a dump can be GBs, iterparse streams it
+            for items in self.read_dump(source):
+                for item in items:
+                    yield item
+        else:
+            yield scrapy.Request(Path(source).resolve().as_uri(), callback=self.parse, dont_filter=True)
+
+    def read_dump(self, path):
+        with open_dump(path) as f:
+            if self.revisions == "all":
+                yield from self.read_all_revisions(f)
+                return
+
+            latest = None
+            for revision in dump_revisions(f, self.title):
+                latest = revision  # in a dump the revisions of a page are oldest first
+        if latest is None:
+            self.logger.warning(f"No revision of {self.title!r} in {path}")
+            return
+        self.logger.info(f"Reading revision {latest['revision_id']} ({latest['timestamp']}) of {self.title!r}")
+        yield list(parse_items(latest["text"], self.item_class()))
+
+    def read_all_revisions(self, f):
+        # the checkpoints: what a previous run already wrote (see SaveRevisionsPipeline)
+        con = db.connect(self.settings.get("SQLITE_DB_PATH", db.DEFAULT_DB_PATH))
+        try:
+            done = db.done_revisions(con)
+        finally:
+            con.close()
+        for revision in dump_revisions(f, self.title):
+            if revision["revision_id"] in done:
+                self.crawler.stats.inc_value("revisions/skipped")
+                continue
+            items = list(parse_items(revision["text"],
+                                     self.item_class(CountriesGdpRevisionItem, CountriesGdpRevisionRecord)))
+            for item in items:
+                adapter = ItemAdapter(item)
+                adapter["revision_id"] = revision["revision_id"]
+                adapter["revision_timestamp"] = revision["timestamp"]
+            self.crawler.stats.inc_value("revisions/fetched")
+            # without the text: SaveRevisionsPipeline keeps the revision until its items are written
+            revision = {key: revision[key] for key in ("revision_id", "parent_id", "timestamp")}
+            self.crawler.signals.send_catch_log(revision_parsed, revision=revision, items=len(items))
+            yield items
+
+    def parse(self, response):
+        # action=raw is text/x-wiki, a local .wikitext file has no known type: decode the body ourselves
+        yield from parse_items(response.body.decode("utf-8"), self.item_class())
@@ -0,0 +1,107 @@
+"""Streaming extraction of the GDP table: the rows are read while the html is parsed, the page is never a whole DOM.
+
+The selector ways (ItemLoader loop, extractors.py) need the DOM of the whole page first: ~10x the size of the html,
+all of it alive until the last row is read. Here the html goes through lxml's HTMLPullParser in chunks and:
+    * a row is read as soon as its </tr> is parsed (extractors.read_row: same cells, same processors)
+    * then it's cleared, with the rows before it, so the tree never holds more than one row of the table
+    * a table is cleared when its </table> is parsed (a page or a dump with many tables doesn't pile them up)
+so the memory used by the parsing stays the same whatever the number of rows. The items are identical to the
+ones of the other modes.
+
+usage: scrapy crawl gdp -a extraction_mode=streaming   (or GDP_EXTRACTION_MODE = "streaming" in settings.py)
+       stream_items(open("big_list.html", "rb")): any iterable of bytes chunks works, i.e. a file read in chunks
+
+The response body itself is still in memory in the spider (scrapy downloads it whole), only the DOM is avoided.
+"""
+from lxml import etree
+
+from .extractors import (COUNTRY_COLUMNS, SOURCE_COLUMNS, build_item, is_record, process_column, read_row,
+                         record_parsers, row_records)
+from .items import CountriesGdpItem
+
+CHUNK_SIZE = 64 * 1024
+
+
+def is_gdp_table(element):
+    # table.wikitable.sortable
+    return {"wikitable", "sortable"} <= set(element.get("class", "").split())
+
+
+def is_gdp_row(row):
+    # table.wikitable.sortable tbody tr:not([class]), checked on the ancestors since the tree is only partly built
+    if "class" in row.attrib:
+        return False
+    in_tbody = False
+    for ancestor in row.iterancestors():
+        if ancestor.tag == "tbody":
+            in_tbody = True
+        elif ancestor.tag == "table" and in_tbody and is_gdp_table(ancestor):
+            return True
+    return False
+
+
+def discard(element):
+    """Free an element we're done with, and its already parsed previous siblings"""
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def body_chunks(body, size=CHUNK_SIZE):
+    view = memoryview(body)
+    for start in range(0, len(view), size):
+        yield view[start:start + size]
+
+
+def stream_rows(chunks, encoding=None, read=read_row):
+    """Yields read(row) for every row of the table, as the rows are parsed. read: extractors.read_row (the raw values
+    of the row) or anything else taking the <tr> element (it's cleared right after)"""
+    parser = etree.HTMLPullParser(events=("end",), tag=("tr", "table"), encoding=encoding)
+    for chunk in chunks:
+        parser.feed(bytes(chunk))
+        yield from _read_events(parser, read)
+    parser.close()
+    yield from _read_events(parser, read)
+
+
+def _read_events(parser, read):
+    for _, element in parser.read_events():
+        if element.tag == "tr":
+            if is_gdp_row(element):
+                yield read(element)
+            # the header rows too: nothing of the table stays in the tree
+            discard(element)
+        else:
+            discard(element)
+
+
+def stream_countries(chunks, item_cls=CountriesGdpItem, encoding=None):
+    """Yields (country article href, [one item per source]) row by row, like extractors.extract_countries"""
+    if is_record(item_cls):
+        parsers = record_parsers(item_cls)
+        yield from stream_rows(chunks, encoding, lambda row: row_records(row, item_cls, parsers))
+        return
+    sources = {source: process_column(item_cls, "source", [[source]])[0] for source in SOURCE_COLUMNS}
+    for row in stream_rows(chunks, encoding):
+        country = {field: process_column(item_cls, field, [row[field]])[0] for field in COUNTRY_COLUMNS}
+        items = []
+        for source in SOURCE_COLUMNS:
+            # same fields, same order as the ItemLoader: country_name, region, gdp, year, source
+            values = dict(country)
+            values["gdp"] = process_column(item_cls, "gdp", [row[source, "gdp"]])[0]
+            values["year"] = process_column(item_cls, "year", [row[source, "year"]])[0]
+            values["source"] = sources[source]
+            items.append(build_item(item_cls, values))
+        yield row["href"], items
+
+
+def stream_response(response, item_cls=CountriesGdpItem):
+    # response.body, not response.selector: no DOM gets built for the response
+    return stream_countries(body_chunks(response.body), item_cls, response.encoding)
+
+
+def stream_items(chunks, item_cls=CountriesGdpItem, encoding=None):
+    for _, items in stream_countries(chunks, item_cls, encoding):
+        yield from items
@@ -0,0 +1,138 @@
+"""Declarative validation of the items, used by CountriesGdpPipeline.
+
+The rules of every field are written once, as data (SCHEMA below):
+
+    "year": Field(int, required=True, min=1900, max=CURRENT_YEAR + 1)
+
+and compiled once, when the pipeline is created, into one check function per field (the field's rules as a list of
+closures): validating an item is then a loop over the fields it has, no rule is looked up per item. The values are
+read through ItemAdapter (scrapy.Item, dict, dataclass or attrs items alike) and never copied: only a rejected item is
+turned into a dict, for the rejects file. Measured on the 639 items of fixtures/gdp_nominal.html: ~5-7µs per
+scrapy.Item and ~7-12µs per record, ItemAdapter included (the crawl stats' validation/avg_us_per_item are higher,
+they include the timer and the rejects).
+
+    validator = Validator(SCHEMA)
+    validator.errors(ItemAdapter(item))  ->  [] | ["year: expected int, got list ([2023, 2022])", ...]
+
+The checks of a field stop at its first error (a list isn't compared to a year bound), the other fields are still
+checked: one rejection lists everything that's wrong with the row.
+"""
+from datetime import date
+
+CURRENT_YEAR = date.today().year
+# the "UN region" column of the table
+REGIONS = frozenset({"Africa", "Americas", "Asia", "Europe", "Oceania"})
+SOURCES = frozenset({"IMF", "World Bank", "UN"})
+
+
+class Field:
+    """The rules of one field: type (one or a tuple of types), required, min/max (numbers), choices, non-empty text.
+    bool is never accepted for int/float (True would pass as 1)"""
+
+    def __init__(self, types, required=False, min=None, max=None, choices=None, non_empty=False):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        self.min = min
+        self.max = max
+        self.choices = frozenset(choices) if choices is not None else None
+        self.non_empty = non_empty
+
+    def compile(self, name):
+        """-> check(value): None when the value is valid (or unset), else the error message.
+        The rules that apply to the field are picked once, here, as a list of small functions: checking a value
+        only runs those, in order, and stops at the first error"""
+        types = self.types
+        type_names = "|".join(t.__name__ for t in types)
+        # type(), not isinstance: bool is a subclass of int
+        if len(types) == 1:
+            expected = types[0]
+
+            def check_type(value):
+                if type(value) is not expected:
+                    return f"{name}: expected {type_names}, got {type(value).__name__} ({value!r:.40})"
+        else:
+            def check_type(value):
+                if type(value) not in types:
+                    return f"{name}: expected {type_names}, got {type(value).__name__} ({value!r:.40})"
+        rules = [check_type]
+
+        if self.non_empty:
+            def check_empty(value):
+                if not value.strip():
+                    return f"{name}: empty"
+            rules.append(check_empty)
+        if self.min is not None:
+            low = self.min
+
+            def check_min(value):
+                if value < low:
+                    return f"{name}: {value!r} < {low}"
+            rules.append(check_min)
+        if self.max is not None:
+            high = self.max
+
+            def check_max(value):
+                if value > high:
+                    return f"{name}: {value!r} > {high}"
+            rules.append(check_max)
+        if self.choices is not None:
+            choices, sorted_choices = self.choices, sorted(self.choices)
+
+            def check_choices(value):
+                if value not in choices:
+                    return f"{name}: {value!r} not one of {sorted_choices}"
+            rules.append(check_choices)
+
+        def check(value):
+            if value is None:
+                return None  # unset: only an error for a required field, see Validator.errors
+            for rule in rules:
+                error = rule(value)
+                if error is not None:
+                    return error
+            return None
+
+        return check
+
+
+SCHEMA = {
+    "country_name": Field(str, required=True, non_empty=True),
+    "region": Field(str, required=True, choices=REGIONS),
+    # a value that isn't a number (parse_gdp returns the text as is) or missing ("—" in the table)
+    "gdp": Field(float, required=True, min=0.0),
+    # parse_year: an int, or the cell's text when it has no year
+    "year": Field(int, required=True, min=1900, max=CURRENT_YEAR + 1),
+    "source": Field(str, required=True, choices=SOURCES),
+    # only set when the spider follows the country links (GDP_FOLLOW_COUNTRIES)
+    "population": Field(int, min=0),
+    "gdp_per_capita": Field(float, min=0.0),
+}
+
+
+class Validator:
+    def __init__(self, schema=SCHEMA):
+        # compiled once: field -> check, fields of the schema only (others, i.e. revision_id, aren't checked)
+        self.checks = {name: field.compile(name) for name, field in schema.items()}
+        self.required = frozenset(name for name, field in schema.items() if field.required)
+
+    def errors(self, adapter):
+        """The error messages of an item (through its ItemAdapter), [] when it's valid"""
+        checks = self.checks
+        errors = []
+        required_seen = 0
+        # the fields that are set only: adapter.get of an unset field of a scrapy.Item costs a KeyError (~1µs,
+        # population/gdp_per_capita are unset on most items)
+        for name in adapter:
+            check = checks.get(name)
+            if check is None:
+                continue
+            value = adapter[name]
+            if value is not None and name in self.required:
+                required_seen += 1
+            error = check(value)
+            if error is not None:
+                errors.append(error)
+        if required_seen < len(self.required):
+            errors.extend(f"{name}: missing" for name in self.checks if name in self.required
+                          and adapter.get(name) is None)
+        return errors
@@ -0,0 +1,297 @@
+"""The GDP table straight from the page's wikitext (the source of the article, not the rendered html).
+
+    {| class="wikitable sortable ..."
+    |- class="static-row-header"                   <- header rows: they have a class, skipped (like tr:not([class]))
+    ! rowspan=2 | Country/Territory
+    |-
+    | {{flag|United States}} || [[Americas]] || 26,854,599 || 2023 || colspan=2 {{N/A|—}} || ...
+    |}
+
+Where the wikitext comes from: the raw source of the page (https://en.wikipedia.org/w/index.php?title=...&action=raw)
+or the <text> of a revision in a MediaWiki XML dump (see spiders/gdp_wikitext.py).
+
+No DOM, no html: the table markup is read line by line, every cell is reduced to its text (links -> their label,
+{{flag|X}} -> X, footnotes and references dropped) and goes through the processors of CountriesGdpItem like the
+html cells do, so the items have the same fields and types. The columns are the ones of extractors.py.
+"""
+import bz2
+import gzip
+import html
+import re
+
+from lxml import etree
+
+from .extractors import (COUNTRY_COLUMNS, SOURCE_COLUMNS, build_item, is_record, parse_value, process_column,
+                         record_parsers, spread_colspans)
+from .items import CountriesGdpItem
+
+REFS = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>|<!--.*?-->", re.S)
+QUOTES = re.compile(r"'{2,}")  # ''italic'' '''bold'''
+HTML_TAGS = re.compile(r"<[^>]+>")
+COLSPAN = re.compile(r"""colspan\s*=\s*["']?(\d+)""", re.I)
+CLASS_ATTRIBUTE = re.compile(r"\bclass\s*=", re.I)
+NAMED_ARGUMENT = re.compile(r"^\s*[\w -]+=")  # {{efn|name=n1|...}}
+# cell attributes directly followed by a template, without "|": colspan=2 {{N/A|—}}
+ATTRIBUTES_BEFORE_TEMPLATE = re.compile(r"""^\s*((?:[\w-]+\s*=\s*(?:"[^"]*"|'[^']*'|[^\s{]+)\s*)+)(\{\{.*)$""", re.S)
+
+# templates that show text, and which argument it is (1: first positional argument)
+TEXT_TEMPLATES = {
+    "flag": 1, "flagcountry": 1, "flagu": 1, "flagdeco": None, "flagicon": None,
+    "n/a": 1, "na": 1, "nts": 1, "nowrap": 1, "nobr": 1, "small": 1, "abbr": 1, "sort": 2,
+}
+# shown when the template has no such argument: {{N/A}} -> "N/A"
+TEMPLATE_DEFAULTS = {"n/a": "N/A", "na": "N/A"}
+# templates linking to the country's article
+FLAG_TEMPLATES = frozenset({"flag", "flagcountry", "flagu"})
+
+
+def split_top_level(text, separator):
+    """Split on separator, except inside [[links]] and {{templates}}"""
+    if "{{" not in text and "[[" not in text:
+        return text.split(separator)  # most cells: no markup to skip
+    parts = []
+    depth = 0
+    start = 0
+    # jump from one bracket/separator to the next instead of looking at every character
+    for token in re.finditer(r"\{\{|\}\}|\[\[|\]\]|" + re.escape(separator), text):
+        value = token.group()
+        if value in ("{{", "[["):
+            depth += 1
+        elif value in ("}}", "]]"):
+            depth = max(depth - 1, 0)
+        elif depth == 0 and token.start() >= start:
+            parts.append(text[start:token.start()])
+            start = token.end()
+    parts.append(text[start:])
+    return parts
+
+
+def find_closing(text, start, opening, closing):
+    # index of the closing of the {{ or [[ at text[start], nested ones included (-1: never closed)
+    depth = 0
+    for token in re.finditer(re.escape(opening) + "|" + re.escape(closing), text[start:]):
+        depth += 1 if token.group() == opening else -1
+        if depth == 0:
+            return start + token.start()
+    return -1
+
+
+def render_template(body, links):
+    """{{name|arg|...}} -> its text: one of the TEXT_TEMPLATES, anything else (footnotes: {{efn}}, {{cn}}...) -> \"\" """
+    args = split_top_level(body, "|")
+    name = args[0].strip().lower()
+    if name not in TEXT_TEMPLATES:
+        return ""
+    positional = [arg for arg in args[1:] if not NAMED_ARGUMENT.match(arg)]
+    position = TEXT_TEMPLATES[name]
+    if position is None:
+        return ""
+    if len(positional) < position:
+        return TEMPLATE_DEFAULTS.get(name, "")
+    text = render(positional[position - 1], links)
+    if name in FLAG_TEMPLATES:
+        links.append(text.strip())
+    return text
+
+
+def render_link(body, links):
+    # [[target|label]] -> label, [[target]] -> target, [[File:...]] -> ""
+    target, _, label = body.partition("|")
+    if ":" in target.lstrip(":") and target.split(":", 1)[0].strip().lower() in ("file", "image", "category"):
+        return ""
+    links.append(target.strip())
+    return render(label, links) if label else target
+
+
+def render(text, links=None):
+    """Wikitext -> text. links: list collecting the targets of the links/flags met, in order"""
+    if "{{" not in text and "[[" not in text:
+        return text
+    links = [] if links is None else links
+    out = []
+    i = 0
+    while i < len(text):
+        if text.startswith("{{", i):
+            end = find_closing(text, i, "{{", "}}")
+            if end < 0:
+                break
+            out.append(render_template(text[i + 2:end], links))
+            i = end + 2
+        elif text.startswith("[[", i):
+            end = find_closing(text, i, "[[", "]]")
+            if end < 0:
+                break
+            out.append(render_link(text[i + 2:end], links))
+            i = end + 2
+        else:
+            next_markup = min((j for j in (text.find("{{", i), text.find("[[", i)) if j >= 0), default=len(text))
+            out.append(text[i:next_markup])
+            i = next_markup
+    return "".join(out)
+
+
+def cell_text(content, links=None):
+    text = render(content, links)
+    text = HTML_TAGS.sub("", QUOTES.sub("", text))
+    return html.unescape(text).replace("\xa0", " ").strip()
+
+
+class Cell:
+    def __init__(self, markup):
+        attributes, content = "", markup
+        parts = split_top_level(markup, "|")
+        if len(parts) > 1:
+            # | attributes | content
+            attributes, content = parts[0], "|".join(parts[1:])
+        else:
+            match = ATTRIBUTES_BEFORE_TEMPLATE.match(markup)
+            if match:
+                attributes, content = match.groups()
+        self.attributes = attributes
+        self.content = content
+        colspan = COLSPAN.search(attributes)
+        self.colspan = colspan.group(1) if colspan else None
+
+
+def logical_lines(text):
+    """The lines of the text, a line continuing until its templates/links are closed (a footnote can span lines)"""
+    lines = []
+    depth = 0
+    for line in text.split("\n"):
+        if depth > 0:
+            lines[-1] += "\n" + line
+        else:
+            lines.append(line)
+        depth += line.count("{{") + line.count("[[") - line.count("}}") - line.count("]]")
+        depth = max(depth, 0)
+    return lines
+
+
+def iter_tables(wikitext):
+    """Yields (table attributes, [(row attributes, [Cell, ...]), ...]) for every top-level table"""
+    wikitext = REFS.sub("", wikitext)
+    tables = []  # stack: nested tables are read but not yielded
+    for line in logical_lines(wikitext):
+        stripped = line.lstrip()
+        if stripped.startswith("{|"):
+            tables.append((stripped[2:].strip(), [("", [])]))
+            continue
+        if not tables:
+            continue
+        attributes, rows = tables[-1]
+        if stripped.startswith("|}"):
+            table = tables.pop()
+            if not tables:
+                yield table
+        elif stripped.startswith("|-"):
+            rows.append((stripped.lstrip("|-").strip(), []))
+        elif stripped.startswith("|+"):
+            continue  # caption
+        elif stripped.startswith("!"):
+            rows[-1][1].extend(Cell(cell) for cell in split_top_level(stripped[1:], "!!"))
+        elif stripped.startswith("|"):
+            rows[-1][1].extend(Cell(cell) for cell in split_top_level(stripped[1:], "||"))
+        elif rows[-1][1]:
+            # continuation of the last cell
+            last = rows[-1][1][-1]
+            last.content += "\n" + line
+
+
+def is_gdp_table(attributes):
+    classes = re.search(r"""class\s*=\s*["']?([^"']*)""", attributes)
+    return classes is not None and {"wikitable", "sortable"} <= set(classes.group(1).split())
+
+
+def country_rows(wikitext):
+    """The cells of every data row (no class attribute) of the wikitable sortable tables"""
+    for attributes, rows in iter_tables(wikitext):
+        if not is_gdp_table(attributes):
+            continue
+        for row_attributes, cells in rows:
+            if cells and not CLASS_ATTRIBUTE.search(row_attributes):
+                yield cells
+
+
+def parse_countries(wikitext, item_cls=CountriesGdpItem):
+    """Yields (country article href, [one item per source]) for every row, like extractors.extract_countries"""
+    if is_record(item_cls):
+        yield from parse_records(wikitext, item_cls)
+        return
+    sources = {source: process_column(item_cls, "source", [[source]])[0] for source in SOURCE_COLUMNS}
+    for cells in country_rows(wikitext):
+        columns = spread_colspans(cells, lambda cell: cell.colspan)
+        links = []
+        texts = {}
+        for field, position in COUNTRY_COLUMNS.items():
+            text = cell_text(cells[position - 1].content, links) if len(cells) >= position else ""
+            texts[field] = process_column(item_cls, field, [[text] if text else []])[0]
+        href = "/wiki/" + links[0].replace(" ", "_") if links else None
+
+        items = []
+        for source, (gdp_position, year_position) in SOURCE_COLUMNS.items():
+            # same fields, same order as the ItemLoader: country_name, region, gdp, year, source
+            values = dict(texts)
+            for field, position in (("gdp", gdp_position), ("year", year_position)):
+                raw = [cell_text(columns[position - 1].content)] if len(columns) >= position else []
+                values[field] = process_column(item_cls, field, [raw])[0]
+            values["source"] = sources[source]
+            items.append(build_item(item_cls, values))
+        yield href, items
+
+
+def parse_records(wikitext, record_cls):
+    """parse_countries with a record class (items.CountriesGdpRecord): one value parsed at a time, no lists"""
+    parsers = record_parsers(record_cls)
+    for cells in country_rows(wikitext):
+        columns = spread_colspans(cells, lambda cell: cell.colspan)
+        links = []
+        country = {}
+        for field, position in COUNTRY_COLUMNS.items():
+            text = cell_text(cells[position - 1].content, links) if len(cells) >= position else None
+            country[field] = parse_value(parsers[field], text)
+        href = "/wiki/" + links[0].replace(" ", "_") if links else None
+
+        records = []
+        for source, (gdp_position, year_position) in SOURCE_COLUMNS.items():
+            gdp = cell_text(columns[gdp_position - 1].content) if len(columns) >= gdp_position else None
+            year = cell_text(columns[year_position - 1].content) if len(columns) >= year_position else None
+            records.append(record_cls(**country, gdp=parse_value(parsers["gdp"], gdp),
+                                      year=parse_value(parsers["year"], year),
+                                      source=parse_value(parsers["source"], source)))
+        yield href, records
+
+
+def parse_items(wikitext, item_cls=CountriesGdpItem):
+    for _, items in parse_countries(wikitext, item_cls):
+        yield from items
+
+
+def open_dump(path):
+    """A MediaWiki XML dump, compressed (.bz2, .gz: how they're distributed) or not"""
+    path = str(path)
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def dump_revisions(file, title=None):
+    """Yields {"title", "revision_id", "parent_id", "timestamp", "text"} for every revision of a MediaWiki XML dump
+    (of the page `title` only if given), read with iterparse: a multi-GB dump never is in memory at once"""
+    page_title = None
+    for _, element in etree.iterparse(file, events=("end",), huge_tree=True):
+        tag = etree.QName(element).localname  # the export namespace has a version: compare local names
+        if tag == "title":
+            page_title = element.text
+        elif tag == "revision":
+            if title is None or page_title == title:
+                fields = {etree.QName(child).localname: child.text for child in element}
+                yield {"title": page_title, "revision_id": int(fields["id"]),
+                       "parent_id": int(fields["parentid"]) if fields.get("parentid") else None,
+                       "timestamp": fields.get("timestamp"), "text": fields.get("text") or ""}
+            element.clear(keep_tail=True)
+        elif tag == "page":
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:  # the pages already read
+                del element.getparent()[0]
@@ -0,0 +1,81 @@
+"""Local stand-in for en.wikipedia.org, serving this directory: no network needed to try the spiders
+
+    python fixtures/serve.py [port]          (default port: 8000)
+    scrapy crawl gdp -a start_url=http://127.0.0.1:8000/gdp_nominal.html -a follow_countries=true
+    scrapy crawl gdp_revisions -a wiki=http://127.0.0.1:8000
+
+The article copies are stored under their wiki path (wiki/United_States, no extension): they're served as
+text/html like on wikipedia. Articles that aren't here are 404s.
+
+The revisions of the list page (revisions/<revid>.wikitext, listed oldest first in revisions/index.json) are served
+like the MediaWiki endpoints the gdp_revisions spider uses:
+    /w/api.php?action=query&prop=revisions&titles=...&rvlimit=N[&rvcontinue=...]   newest first, N per page
+    /w/index.php?oldid=<revid>&action=raw                                           the wikitext of a revision
+"""
+import json
+import sys
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = Path(__file__).resolve().parent
+REVISIONS_DIR = FIXTURES_DIR / "revisions"
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    def guess_type(self, path):
+        if not Path(path).suffix:
+            return "text/html; charset=utf-8"
+        return super().guess_type(path)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if url.path == "/w/api.php":
+            return self.api(query)
+        if url.path == "/w/index.php" and query.get("action") == "raw":
+            return self.raw(query)
+        return super().do_GET()
+
+    def api(self, query):
+        index = json.loads((REVISIONS_DIR / "index.json").read_text(encoding="utf-8"))
+        if query.get("titles") != index["title"]:
+            return self.send_json({"batchcomplete": True, "query": {"pages": [{"title": query.get("titles"),
+                                                                                "missing": True}]}})
+        revisions = sorted(index["revisions"], key=lambda revision: revision["revid"], reverse=True)
+        if "rvcontinue" in query:
+            revisions = [revision for revision in revisions if revision["revid"] <= int(query["rvcontinue"])]
+        limit = int(query.get("rvlimit", 50))
+        data = {"query": {"pages": [{"title": index["title"], "revisions": revisions[:limit]}]}}
+        if len(revisions) > limit:
+            data["continue"] = {"rvcontinue": str(revisions[limit]["revid"]), "continue": "||"}
+        else:
+            data["batchcomplete"] = True
+        self.send_json(data)
+
+    def raw(self, query):
+        path = REVISIONS_DIR / f"{query.get('oldid', '')}.wikitext"
+        if not query.get("oldid", "").isdigit() or not path.exists():
+            return self.send_error(404)
+        self.send_body(path.read_bytes(), "text/x-wiki; charset=UTF-8")
+
+    def send_json(self, data):
+        self.send_body(json.dumps(data).encode("utf-8"), "application/json; charset=utf-8")
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port=8000, directory=FIXTURES_DIR):
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(FixtureHandler, directory=str(directory)))
+    print(f"serving {directory} on http://127.0.0.1:{port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
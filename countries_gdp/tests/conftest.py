@@ -0,0 +1,73 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_DIR))  # countries_gdp and benchmarks, whatever the directory pytest runs from
+FIXTURES_DIR = PROJECT_DIR / "fixtures"
+
+# a crawl of the tests: nothing from the network or from a previous crawl, every file in the test's tmp_path
+TEST_SETTINGS = {
+    "HTTPCACHE_ENABLED": "False",
+    # no endpoint (METRICS_PORT=0), only the snapshots: the last one has the stats of the crawl
+    "METRICS_ENABLED": "True",
+    "METRICS_PORT": "0",
+    "ROBOTSTXT_OBEY": "False",
+    "AUTOTHROTTLE_ENABLED": "False",
+    "LOG_LEVEL": "INFO",
+}
+
+
+@pytest.fixture
+def crawl(tmp_path):
+    """crawl(spider, db_path, *args, settings={...}) -> the stats of the crawl (dict)
+
+    `scrapy crawl` in a subprocess: one reactor per crawl, like on the command line"""
+
+    def run(spider, db_path, *args, settings=None):
+        snapshots_path = tmp_path / "metrics.jsonl"
+        snapshots_path.unlink(missing_ok=True)
+        settings = {**TEST_SETTINGS, "SQLITE_DB_PATH": str(db_path), "METRICS_SNAPSHOT_PATH": str(snapshots_path),
+                    "VALIDATION_REJECTS_PATH": str(tmp_path / "rejects.jsonl"),
+                    "CHANGE_DETECTION_DIFF_PATH": str(tmp_path / "changes.jsonl"),
+                    **(settings or {})}
+        command = [sys.executable, "-m", "scrapy", "crawl", spider]
+        for name, value in settings.items():
+            command += ["-s", f"{name}={value}"]
+        for arg in args:
+            command += ["-a", arg]
+        subprocess.run(command, cwd=PROJECT_DIR, check=True, timeout=120)
+        return json.loads(snapshots_path.read_text().splitlines()[-1])["stats"]
+
+    return run
+
+
+@pytest.fixture
+def wiki(tmp_path):
+    """fixtures/serve.py on a free port -> (its url, the file its request log goes to)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    log_path = tmp_path / "serve.log"
+    with open(log_path, "w") as log:
+        server = subprocess.Popen([sys.executable, str(FIXTURES_DIR / "serve.py"), str(port)], stdout=log,
+                                  stderr=log)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}", log_path
+    finally:
+        server.terminate()
+        server.wait()
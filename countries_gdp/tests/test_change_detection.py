@@ -0,0 +1,60 @@
+"""ChangeDetectionPipeline: the hashes are the ones of the rows in the db the crawl writes to"""
+import sqlite3
+
+from conftest import FIXTURES_DIR
+
+SOURCE = f"source={FIXTURES_DIR / 'gdp_nominal.wikitext'}"
+ROWS = 586  # rows of the fixture
+
+
+def count_rows(db_path, table="countries_gdp"):
+    con = sqlite3.connect(db_path)
+    try:
+        return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        con.close()
+
+
+def test_recrawl_same_db_only_writes_changes(crawl, tmp_path):
+    db_path = tmp_path / "a.db"
+    stats = crawl("gdp_wikitext", db_path, SOURCE)
+    assert stats["changes/added"] == ROWS
+    assert count_rows(db_path) == count_rows(db_path, "content_hashes") == ROWS
+
+    stats = crawl("gdp_wikitext", db_path, SOURCE)
+    assert stats["changes/unchanged"] == ROWS
+    assert "changes/added" not in stats
+    assert count_rows(db_path) == ROWS
+
+
+def test_crawl_into_another_db_writes_every_row(crawl, tmp_path):
+    crawl("gdp_wikitext", tmp_path / "a.db", SOURCE)
+
+    stats = crawl("gdp_wikitext", tmp_path / "b.db", SOURCE)
+    assert stats["changes/added"] == ROWS
+    assert "changes/unchanged" not in stats
+    assert count_rows(tmp_path / "b.db") == ROWS
+
+
+def test_crawl_into_deleted_db_writes_every_row(crawl, tmp_path):
+    db_path = tmp_path / "a.db"
+    crawl("gdp_wikitext", db_path, SOURCE)
+    db_path.unlink()
+    for suffix in ("-wal", "-shm"):
+        (tmp_path / f"a.db{suffix}").unlink(missing_ok=True)
+
+    stats = crawl("gdp_wikitext", db_path, SOURCE)
+    assert stats["changes/added"] == ROWS
+    assert count_rows(db_path) == ROWS
+
+
+def test_rows_not_written_are_not_unchanged(crawl, tmp_path):
+    # first crawl without the db pipeline: nothing written, so nothing can be "unchanged" the next time
+    db_path = tmp_path / "a.db"
+    crawl("gdp_wikitext", db_path, SOURCE,
+          settings={"ITEM_PIPELINES": '{"countries_gdp.pipelines.CountriesGdpPipeline": 100, '
+                                      '"countries_gdp.pipelines.ChangeDetectionPipeline": 250}'})
+
+    stats = crawl("gdp_wikitext", db_path, SOURCE)
+    assert stats["changes/added"] == ROWS
+    assert count_rows(db_path) == ROWS
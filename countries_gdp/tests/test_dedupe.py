@@ -0,0 +1,85 @@
+"""The dedupe backends of NoDuplicateCountryPipeline"""
+import hashlib
+
+import pytest
+
+from countries_gdp import dedupe
+
+KEYS = [(f"Country {n}", source) for n in range(3000) for source in ("IMF", "World Bank", "UN")]
+
+
+@pytest.fixture(params=["memory", "hashed", "bloom", "sqlite"])
+def backend(request, tmp_path):
+    backend = {
+        "memory": lambda: dedupe.MemorySetBackend(),
+        "hashed": lambda: dedupe.HashedSetBackend(initial_size=16),
+        "bloom": lambda: dedupe.BloomFilterBackend(capacity=100_000, error_rate=0.001),
+        "sqlite": lambda: dedupe.SqliteBackend(path=str(tmp_path / "dedupe.db")),
+    }[request.param]()
+    backend.open()
+    yield backend
+    backend.close()
+
+
+def test_new_then_duplicate(backend):
+    assert all(backend.add(key) for key in KEYS)
+    assert not any(backend.add(key) for key in KEYS)
+    assert backend.stats()["keys"] == len(KEYS)
+
+
+def test_hashed_growth():
+    backend = dedupe.HashedSetBackend(initial_size=16)
+    for key in KEYS:
+        backend.add(key)
+    # the table doubles to keep the load factor under 1/2, every key survives the rehashes
+    assert len(backend.table) == 32768 and backend.count == len(KEYS)  # 9000 keys: 16384 slots is over 1/2
+    assert backend.stats()["memory_bytes"] == 32768 * 8
+    assert not any(backend.add(key) for key in KEYS)
+
+
+def test_fingerprint_is_stable():
+    # not hash(), which changes with every process: the fingerprints are kept across runs
+    digest = hashlib.blake2b("France\x1fIMF".encode("utf-8"), digest_size=8).digest()
+    assert dedupe.fingerprint(("France", "IMF")) == int.from_bytes(digest, "little")
+    assert dedupe.fingerprint(("France", None)) == dedupe.fingerprint(("France", ""))
+
+
+def test_bloom_across_runs(tmp_path):
+    path = str(tmp_path / "dedupe.bloom")
+    first = dedupe.BloomFilterBackend(capacity=100_000, error_rate=0.001, path=path)
+    first.open()
+    for key in KEYS[:1000]:
+        assert first.add(key)
+    first.close()
+
+    second = dedupe.BloomFilterBackend(capacity=100_000, error_rate=0.001, path=path)
+    second.open()
+    assert second.count == 1000
+    assert not any(second.add(key) for key in KEYS[:1000])
+    assert sum(second.add(key) for key in KEYS[1000:]) >= len(KEYS) - 1000 - 10  # ~0.1% false positives
+    second.close()
+
+    # saved with another size: not reused
+    other = dedupe.BloomFilterBackend(capacity=1000, error_rate=0.01, path=path)
+    other.open()
+    assert other.count == 0 and other.add(KEYS[0])
+
+
+def test_sqlite_across_runs(tmp_path):
+    path = str(tmp_path / "dedupe.db")
+    first = dedupe.SqliteBackend(path=path, commit_every=100)
+    first.open()
+    for key in KEYS[:1000]:
+        assert first.add(key)
+    first.close()
+
+    second = dedupe.SqliteBackend(path=path)
+    second.open()
+    assert not any(second.add(key) for key in KEYS[:1000])
+    assert all(second.add(key) for key in KEYS[1000:])
+    stats = second.stats()
+    assert stats["keys"] == len(KEYS)
+    assert stats["disk_bytes"] > 0
+    assert stats["cache_limit_bytes"] == 20000 * 1024  # db.connect's cache_size=-20000 (KiB)
+    assert "memory_bytes" not in stats
+    second.close()
@@ -0,0 +1,36 @@
+"""Every extraction mode and item type of GdpSpider gives the same items as the ItemLoader path"""
+import json
+
+import pytest
+from itemadapter import ItemAdapter
+
+from benchmarks.common import fixture_response
+from countries_gdp.spiders.gdp import GdpSpider
+
+
+def serialized(extraction_mode, item_type="item"):
+    items = GdpSpider(extraction_mode=extraction_mode, item_type=item_type).parse(fixture_response())
+    # a record has every field (None when unset), an Item only the fields that were set
+    return [json.dumps({name: value for name, value in ItemAdapter(item).items() if value is not None}, sort_keys=True)
+            for item in items]
+
+
+@pytest.fixture(scope="module")
+def loader_items():
+    return serialized("loader")
+
+
+def test_loader_items(loader_items):
+    assert len(loader_items) == 639  # 213 rows x 3 sources
+    assert all("null" not in item for item in loader_items)  # an Item is compared as it is
+
+
+@pytest.mark.parametrize("extraction_mode, item_type", [
+    ("compiled", "item"),
+    ("streaming", "item"),
+    ("loader", "record"),
+    ("compiled", "record"),
+    ("streaming", "record"),
+])
+def test_same_items_as_loader(loader_items, extraction_mode, item_type):
+    assert serialized(extraction_mode, item_type) == loader_items
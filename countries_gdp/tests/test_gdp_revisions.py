@@ -0,0 +1,91 @@
+"""gdp_revisions against fixtures/serve.py: interrupted, resumed, every revision written once"""
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from countries_gdp import db
+from countries_gdp.items import CountriesGdpRevisionItem
+from countries_gdp.pipelines import SaveRevisionsPipeline
+
+# fixtures/revisions: the first one is a stub without the table
+REVISIONS = {1100000001: 0, 1120000002: 586, 1140000003: 586, 1150000004: 586, 1160000005: 586}
+
+
+def fetched(log_path):
+    """The revision ids fetched so far, in the server's request log"""
+    return re.findall(r"GET /w/index\.php\?oldid=(\d+)&action=raw", log_path.read_text())
+
+
+def written(db_path):
+    con = sqlite3.connect(db_path)
+    try:
+        revisions = dict(con.execute("SELECT revision_id, rows FROM revisions"))
+        rows = dict(con.execute("SELECT revision_id, COUNT(*) FROM countries_gdp_revisions GROUP BY revision_id"))
+    finally:
+        con.close()
+    return revisions, rows
+
+
+def assert_complete(db_path):
+    revisions, rows = written(db_path)
+    assert revisions == REVISIONS
+    assert rows == {revision_id: count for revision_id, count in REVISIONS.items() if count}
+
+
+def test_resume_after_limit(crawl, wiki, tmp_path):
+    url, log_path = wiki
+    db_path = tmp_path / "revisions.db"
+
+    stats = crawl("gdp_revisions", db_path, f"wiki={url}", "limit=2")
+    assert stats["revisions/fetched"] == stats["revisions/written"] == 2
+    assert sorted(written(db_path)[0]) == [1150000004, 1160000005]  # newest first
+
+    stats = crawl("gdp_revisions", db_path, f"wiki={url}")
+    assert stats["revisions/skipped"] == 2
+    assert stats["revisions/fetched"] == 3
+    assert_complete(db_path)
+    assert sorted(map(int, fetched(log_path))) == sorted(REVISIONS)  # each one fetched once
+
+    stats = crawl("gdp_revisions", db_path, f"wiki={url}")
+    assert "revisions/fetched" not in stats
+    assert len(fetched(log_path)) == len(REVISIONS)
+
+
+def test_resume_after_shutdown(crawl, wiki, tmp_path):
+    url, log_path = wiki
+    db_path = tmp_path / "revisions.db"
+
+    # closed partway, like a ctrl-c: the revisions already fetched are finished, the others aren't requested
+    crawl("gdp_revisions", db_path, f"wiki={url}",
+          settings={"CLOSESPIDER_ITEMCOUNT": 100, "CONCURRENT_REQUESTS": 1, "DOWNLOAD_DELAY": 0.5,
+                    "AUTOTHROTTLE_ENABLED": False})
+    first_run = written(db_path)[0]
+    assert 0 < len(first_run) < len(REVISIONS)
+    fetched_before = len(fetched(log_path))
+
+    crawl("gdp_revisions", db_path, f"wiki={url}")
+    assert_complete(db_path)
+    # the checkpointed revisions aren't fetched again
+    assert not set(map(int, fetched(log_path)[fetched_before:])) & set(first_run)
+
+
+def test_failed_write_counted_once(tmp_path, monkeypatch):
+    pipeline = SaveRevisionsPipeline(db_path=str(tmp_path / "revisions.db"))
+    pipeline.open_spider(None)
+    try:
+        def fail(*args):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(db, "write_revision", fail)
+        revision = {"revision_id": 1, "parent_id": None, "timestamp": datetime.now(timezone.utc).isoformat()}
+        pipeline.revision_parsed(revision, items=1)
+        item = CountriesGdpRevisionItem(country_name="France", source="IMF", revision_id=1)
+        with pytest.raises(sqlite3.OperationalError):
+            pipeline.process_item(item, None)
+        # scrapy sends item_error for the item whose write failed: nothing left to count or write
+        pipeline.item_left(item, None)
+        assert not (pipeline.expected or pipeline.done or pipeline.rows or pipeline.revisions)
+    finally:
+        pipeline.close_spider(None)
@@ -0,0 +1,48 @@
+"""gdp_wikitext -a revisions=all: every revision of a dump in countries_gdp_revisions"""
+import sqlite3
+
+from conftest import FIXTURES_DIR
+
+DUMP = f"source={FIXTURES_DIR / 'gdp_nominal_dump.xml'}"
+
+
+def test_all_revisions_of_a_dump(crawl, tmp_path):
+    db_path = tmp_path / "revisions.db"
+    stats = crawl("gdp_wikitext", db_path, DUMP, "revisions=all")
+    assert stats["revisions/written"] == 2
+
+    con = sqlite3.connect(db_path)
+    try:
+        # the countries of the second revision aren't dropped as duplicates of the first
+        assert con.execute("SELECT revision_id, COUNT(*) FROM countries_gdp_revisions GROUP BY revision_id "
+                           "ORDER BY revision_id").fetchall() == [(1150000001, 586), (1160000002, 586)]
+    finally:
+        con.close()
+
+    # the checkpoints: nothing read again
+    stats = crawl("gdp_wikitext", db_path, DUMP, "revisions=all")
+    assert stats["revisions/skipped"] == 2
+    assert "revisions/fetched" not in stats
+
+
+def rows(db_path, sql):
+    con = sqlite3.connect(db_path)
+    try:
+        return con.execute(sql).fetchall()
+    finally:
+        con.close()
+
+
+def test_records_give_the_same_rows(crawl, tmp_path):
+    source = f"source={FIXTURES_DIR / 'gdp_nominal.wikitext'}"
+    sql = "SELECT country_name, source, region, gdp, year FROM countries_gdp ORDER BY country_name, source"
+    crawl("gdp_wikitext", tmp_path / "items.db", source)
+    crawl("gdp_wikitext", tmp_path / "records.db", source, "item_type=record")
+    assert rows(tmp_path / "records.db", sql) == rows(tmp_path / "items.db", sql)
+    assert len(rows(tmp_path / "records.db", sql)) == 586
+
+    # GDP_ITEM_TYPE too, and the revisions of a dump
+    sql = "SELECT revision_id, country_name, source, gdp FROM countries_gdp_revisions ORDER BY 1, 2, 3"
+    crawl("gdp_wikitext", tmp_path / "item_revisions.db", DUMP, "revisions=all")
+    crawl("gdp_wikitext", tmp_path / "record_revisions.db", DUMP, "revisions=all", settings={"GDP_ITEM_TYPE": "record"})
+    assert rows(tmp_path / "record_revisions.db", sql) == rows(tmp_path / "item_revisions.db", sql)
@@ -0,0 +1,78 @@
+"""The history queries on a seeded countries_gdp_history"""
+import pytest
+
+from countries_gdp import db, history
+
+# snapshot -> rows written by that crawl (with change detection only the changed ones, none for a skipped page)
+SNAPSHOTS = [
+    [("France", "IMF", "Europe", 3000.0, 2023), ("Germany", "IMF", "Europe", 4000.0, 2023),
+     ("Italy", "IMF", "Europe", 2000.0, 2023), ("Japan", "IMF", "Asia", 4200.0, 2023),
+     ("France", "World Bank", "Europe", 2900.0, 2022)],
+    [("France", "IMF", "Europe", 3100.0, 2023), ("Spain", "IMF", "Europe", 1500.0, 2023)],
+    [],
+    [("Germany", "IMF", "Europe", 3800.0, 2023)],
+]
+
+
+@pytest.fixture
+def con(tmp_path):
+    con = db.connect(str(tmp_path / "history.db"))
+    db.create_table(con)
+    db.create_history_tables(con)
+    for n, rows in enumerate(SNAPSHOTS, start=1):
+        started_at = f"2024-01-0{n}T00:00:00+00:00"
+        snapshot_id = db.start_snapshot(con, "gdp", started_at)
+        assert snapshot_id == n
+        db.write_rows(con, [row + (None, None, started_at) for row in rows], db.UPSERT_SQL, snapshot_id)
+        db.finish_snapshot(con, snapshot_id, started_at)
+    yield con
+    con.close()
+
+
+def test_snapshots(con):
+    assert [snapshot["rows"] for snapshot in history.snapshots(con)] == [5, 2, 0, 1]
+
+
+def test_top_latest(con):
+    assert [(row["country_name"], row["gdp"], row["snapshot_id"]) for row in history.top(con, "Europe", n=3)] == [
+        ("Germany", 3800.0, 4), ("France", 3100.0, 2), ("Italy", 2000.0, 1)]
+
+
+def test_top_as_of(con):
+    assert [(row["country_name"], row["gdp"]) for row in history.top(con, "Europe", snapshot_id=1)] == [
+        ("Germany", 4000.0), ("France", 3000.0), ("Italy", 2000.0)]
+    # the empty snapshot 3: same values as snapshot 2
+    assert history.top(con, "Europe", snapshot_id=3) == history.top(con, "Europe", snapshot_id=2)
+    assert history.top(con, "Europe", source="World Bank", year=2022)[0]["gdp"] == 2900.0
+    assert history.top(con, "Europe", year=2021) == []
+
+
+def test_delta(con):
+    assert [(row["country_name"], row["gdp_before"], row["gdp_after"], row["gdp_delta"])
+            for row in history.delta(con, 1, 2)] == [("Spain", None, 1500.0, None), ("France", 3000.0, 3100.0, 100.0)]
+    assert [(row["country_name"], row["gdp_delta"]) for row in history.delta(con, 1, 4, source="IMF", region="Europe")] \
+        == [("Spain", None), ("Germany", -200.0), ("France", 100.0)]
+    assert history.delta(con, 2, 3) == []
+    assert history.delta(con, 1, 2, region="Asia") == []
+
+
+def test_series(con):
+    assert [(row["source"], row["snapshot_id"], row["gdp"]) for row in history.series(con, "France")] == [
+        ("IMF", 1, 3000.0), ("IMF", 2, 3100.0), ("World Bank", 1, 2900.0)]
+    assert [row["gdp"] for row in history.series(con, "France", source="World Bank", year=2022)] == [2900.0]
+
+
+@pytest.mark.parametrize("sql, params", [
+    history.top_query("Europe"),
+    history.top_query("Europe", year=2023),
+    history.delta_query(1, 4, source="IMF"),
+    history.series_query("France"),
+    history.series_query("France", year=2023),
+])
+def test_no_full_scan(con, sql, params):
+    assert not [step for step in history.explain(con, sql, params) if step.startswith("SCAN")]
+
+
+def test_cli(con, tmp_path, capsys):
+    history.main(["--db", str(tmp_path / "history.db"), "top", "Europe", "-n", "1"])
+    assert capsys.readouterr().out.splitlines() == ["country_name\tgdp\tyear\tsnapshot_id", "Germany\t3800.0\t2023\t4"]
@@ -0,0 +1,64 @@
+"""The field processors of items.py on the cells of the table"""
+import pytest
+from scrapy.loader import ItemLoader
+
+from countries_gdp.items import CountriesGdpItem, parse_amount, parse_count, parse_gdp, parse_year, strip_tags
+
+
+@pytest.mark.parametrize("cell, gdp", [
+    ("<td>26,854,599</td>", 26854599.0),
+    ("<td>26,854,599<sup>[n 1]</sup></td>", 26854599.0),
+    ('<td>26,854,599<sup class="reference"><a href="#cite_note-1">[1]</a></sup></td>', 26854599.0),
+    ("<td> 1,234.5 </td>", 1234.5),
+    ("<td>26,854,599[n 1]</td>", 26854599.0),
+    # missing values: the field stays unset
+    ("<td>—</td>", None),
+    ("<td>–</td>", None),
+    ("<td>-</td>", None),
+    ("<td>N/A</td>", None),
+    ("<td></td>", None),
+    ('<td colspan="2"><span>—</span></td>', None),
+    ("<td><sup>[n 2]</sup></td>", None),
+    # not a number: the text, CountriesGdpPipeline drops it
+    ("<td>unknown</td>", "unknown"),
+    ("<td>~26,000</td>", "~26,000"),
+])
+def test_parse_gdp(cell, gdp):
+    assert parse_gdp(cell) == gdp
+
+
+@pytest.mark.parametrize("cell, year", [
+    ("<td>2023</td>", 2023),
+    ("<td>[n 1]2023</td>", 2023),
+    ("<td>2023<sup>[5]</sup></td>", 2023),
+    ("<td><sup>[n 1]</sup>2022</td>", 2022),
+    ("<td>—</td>", None),
+    ("<td>-</td>", None),
+    ("<td></td>", None),
+    # a 4 digit group of a number isn't a year
+    ("<td>26,854,599</td>", "26,854,599"),
+    ("<td>1,234.5</td>", "1,234.5"),
+    ("<td>n.d.</td>", "n.d."),
+])
+def test_parse_year(cell, year):
+    assert parse_year(cell) == year
+
+
+def test_country_article_cells():
+    assert parse_count("<td>334,914,895<sup>[8]</sup> (<a>3rd</a>)</td>") == 334914895
+    assert parse_amount("<td>$80,412<sup>[9]</sup> (7th)</td>") == 80412.0
+    assert parse_count("<td>—</td>") is None
+
+
+def test_strip_tags():
+    assert strip_tags('<a href="/wiki/France" title="France">France</a>') == "France"
+    assert strip_tags("  France ") == "France"
+
+
+def test_loader_leaves_missing_values_unset():
+    loader = ItemLoader(item=CountriesGdpItem())
+    loader.add_value("country_name", '<a href="/wiki/Cuba">Cuba</a>')
+    loader.add_value("gdp", "<td>—</td>")
+    loader.add_value("year", "<td>2023<sup>[5]</sup></td>")
+    item = loader.load_item()
+    assert dict(item) == {"country_name": "Cuba", "year": 2023}
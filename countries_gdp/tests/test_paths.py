@@ -0,0 +1,22 @@
+"""optional_path: "None" on the command line turns a file off, it doesn't create a file named None"""
+import pytest
+from scrapy.settings import Settings
+
+from conftest import FIXTURES_DIR, PROJECT_DIR
+from countries_gdp.paths import optional_path
+
+
+@pytest.mark.parametrize("value", [None, "", "None", "none", " None "])
+def test_disabled(value):
+    assert optional_path(Settings({"VALIDATION_REJECTS_PATH": value}), "VALIDATION_REJECTS_PATH") is None
+
+
+def test_path_and_default():
+    assert optional_path(Settings({"METRICS_SNAPSHOT_PATH": "metrics.jsonl"}), "METRICS_SNAPSHOT_PATH") == "metrics.jsonl"
+    assert optional_path(Settings(), "CHANGE_DETECTION_DIFF_PATH", "changes.jsonl") == "changes.jsonl"
+
+
+def test_command_line_none_creates_no_file(crawl, tmp_path):
+    crawl("gdp_wikitext", tmp_path / "a.db", f"source={FIXTURES_DIR / 'gdp_nominal.wikitext'}",
+          settings={"VALIDATION_REJECTS_PATH": "None", "CHANGE_DETECTION_DIFF_PATH": "None"})
+    assert not (PROJECT_DIR / "None").exists()
@@ -0,0 +1,23 @@
+"""AsyncSaveToDatabasePipeline: backpressure without stalls"""
+import sqlite3
+import time
+
+from conftest import FIXTURES_DIR
+
+SOURCE = f"source={FIXTURES_DIR / 'gdp_nominal.wikitext'}"
+
+
+def test_queue_smaller_than_batch_does_not_wait_for_the_interval(crawl, tmp_path):
+    db_path = tmp_path / "a.db"
+    start = time.monotonic()
+    stats = crawl("gdp_wikitext", db_path, SOURCE,
+                  settings={"SQLITE_QUEUE_SIZE": 50, "SQLITE_BATCH_SIZE": 500, "SQLITE_FLUSH_INTERVAL": 30})
+    # 586 rows: 12 slot-fulls, each would have waited for the 30s interval
+    assert time.monotonic() - start < 20
+    assert stats["sqlite/rows_flushed"] == 586
+
+    con = sqlite3.connect(db_path)
+    try:
+        assert con.execute("SELECT COUNT(*) FROM countries_gdp").fetchone()[0] == 586
+    finally:
+        con.close()
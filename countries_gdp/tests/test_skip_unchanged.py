@@ -0,0 +1,68 @@
+"""GDP_SKIP_UNCHANGED: a 304 from the http cache is only skipped when the page's rows are in the target db"""
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def crawl_page(crawl, wiki, tmp_path):
+    url, _ = wiki
+
+    def run(db_path, settings=None):
+        return crawl("gdp", db_path, f"start_url={url}/gdp_nominal.html",
+                     settings={"HTTPCACHE_ENABLED": "True", "HTTPCACHE_SQLITE_PATH": str(tmp_path / "httpcache.db"),
+                               **(settings or {})})
+
+    return run
+
+
+def count_rows(db_path):
+    con = sqlite3.connect(db_path)
+    try:
+        return con.execute("SELECT COUNT(*) FROM countries_gdp").fetchone()[0]
+    finally:
+        con.close()
+
+
+def test_unchanged_page_skipped_when_its_rows_are_in_the_db(crawl_page, tmp_path):
+    db_path = tmp_path / "a.db"
+    crawl_page(db_path)
+    rows = count_rows(db_path)
+    assert rows > 0
+
+    stats = crawl_page(db_path)
+    assert stats["gdp/unchanged_pages_skipped"] == 1
+    assert count_rows(db_path) == rows
+
+
+def test_deleted_db_gets_every_row_again(crawl_page, tmp_path):
+    db_path = tmp_path / "a.db"
+    crawl_page(db_path)
+    rows = count_rows(db_path)
+    for suffix in ("", "-wal", "-shm"):
+        (tmp_path / f"a.db{suffix}").unlink(missing_ok=True)
+
+    feed = tmp_path / "again.json"
+    stats = crawl_page(db_path, settings={"FEEDS": json.dumps({str(feed): {"format": "json", "overwrite": True}})})
+    assert "gdp/unchanged_pages_skipped" not in stats  # the http cache still answers 304
+    assert count_rows(db_path) == rows
+    assert len(json.loads(feed.read_text())) == rows
+
+
+def test_other_db_gets_every_row(crawl_page, tmp_path):
+    crawl_page(tmp_path / "a.db")
+
+    stats = crawl_page(tmp_path / "b.db")
+    assert "gdp/unchanged_pages_skipped" not in stats
+    assert count_rows(tmp_path / "b.db") == count_rows(tmp_path / "a.db")
+
+
+def test_feed_never_skipped(crawl_page, tmp_path):
+    db_path = tmp_path / "a.db"
+    crawl_page(db_path)
+
+    # the rows are in a.db, but a feed is only filled by parsing the page (with the changes, see ChangeDetectionPipeline)
+    stats = crawl_page(db_path, settings={"FEEDS": json.dumps({str(tmp_path / "again.json"): {"format": "json"}})})
+    assert "gdp/unchanged_pages_skipped" not in stats
+    assert stats["changes/unchanged"] == count_rows(db_path)
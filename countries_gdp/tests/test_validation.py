@@ -0,0 +1,81 @@
+"""validation.Validator and the rejects file of CountriesGdpPipeline"""
+import json
+from types import SimpleNamespace
+
+import pytest
+from itemadapter import ItemAdapter
+
+from countries_gdp.items import CountriesGdpItem, CountriesGdpRecord
+from countries_gdp.pipelines import CountriesGdpPipeline, InvalidGdp, InvalidItem
+from countries_gdp.validation import CURRENT_YEAR, Field, Validator
+
+VALID = {"country_name": "France", "region": "Europe", "gdp": 3030904.0, "year": 2023, "source": "IMF"}
+
+
+def errors(**fields):
+    return Validator().errors(ItemAdapter(CountriesGdpItem(**{**VALID, **fields})))
+
+
+@pytest.mark.parametrize("item_cls", [CountriesGdpItem, CountriesGdpRecord, dict])
+def test_valid(item_cls):
+    assert Validator().errors(ItemAdapter(item_cls(**VALID))) == []
+    assert errors(population=68_000_000, gdp_per_capita=44_000.0) == []
+
+
+@pytest.mark.parametrize("fields, expected", [
+    ({"gdp": "n/a"}, ["gdp: expected float, got str ('n/a')"]),
+    ({"gdp": -1.0}, ["gdp: -1.0 < 0.0"]),
+    ({"year": True}, ["year: expected int, got bool (True)"]),  # a bool isn't an int here
+    ({"year": 1899}, ["year: 1899 < 1900"]),
+    ({"year": CURRENT_YEAR + 2}, [f"year: {CURRENT_YEAR + 2} > {CURRENT_YEAR + 1}"]),
+    ({"region": "Atlantis"}, ["region: 'Atlantis' not one of ['Africa', 'Americas', 'Asia', 'Europe', 'Oceania']"]),
+    ({"country_name": "  "}, ["country_name: empty"]),
+    ({"source": "OECD"}, ["source: 'OECD' not one of ['IMF', 'UN', 'World Bank']"]),
+    ({"population": -5}, ["population: -5 < 0"]),
+    # every wrong field is reported, not only the first one
+    ({"gdp": "n/a", "year": "n.d."}, ["gdp: expected float, got str ('n/a')", "year: expected int, got str ('n.d.')"]),
+])
+def test_rejected(fields, expected):
+    assert errors(**fields) == expected
+
+
+def test_missing_required():
+    item = CountriesGdpItem(country_name="Cuba", region="Americas", source="UN")
+    assert Validator().errors(ItemAdapter(item)) == ["gdp: missing", "year: missing"]
+    record = CountriesGdpRecord(country_name="Cuba", region="Americas", source="UN")  # None fields: missing too
+    assert Validator().errors(ItemAdapter(record)) == ["gdp: missing", "year: missing"]
+
+
+def test_fields_outside_the_schema_are_ignored():
+    assert Validator().errors(ItemAdapter({**VALID, "revision_id": "not checked"})) == []
+
+
+def test_field_with_several_types():
+    check = Field((int, float), min=0).compile("value")
+    assert check(1) is None and check(1.5) is None and check(None) is None
+    assert check("1") == "value: expected int|float, got str ('1')"
+    assert check(-1) == "value: -1 < 0"
+
+
+def test_rejects_file(tmp_path):
+    rejects_path = tmp_path / "rejects.jsonl"
+    pipeline = CountriesGdpPipeline(rejects_path=str(rejects_path))
+    spider = SimpleNamespace(name="gdp")
+
+    assert pipeline.process_item(CountriesGdpItem(**VALID), spider)
+    assert not rejects_path.exists()  # opened on the first rejection only
+    with pytest.raises(InvalidGdp):
+        pipeline.process_item(CountriesGdpItem(**{**VALID, "gdp": None}), spider)
+    with pytest.raises(InvalidItem) as rejected:
+        pipeline.process_item(CountriesGdpItem(**{**VALID, "region": "Atlantis", "year": "n.d."}), spider)
+    assert not isinstance(rejected.value, InvalidGdp)  # not only the estimate is wrong
+    pipeline.close_spider(spider)
+
+    records = [json.loads(line) for line in rejects_path.read_text(encoding="utf-8").splitlines()]
+    assert [record["errors"] for record in records] == [
+        ["gdp: missing"],
+        ["region: 'Atlantis' not one of ['Africa', 'Americas', 'Asia', 'Europe', 'Oceania']",
+         "year: expected int, got str ('n.d.')"]]
+    assert records[1]["item"] == {**VALID, "region": "Atlantis", "year": "n.d."}
+    assert all(record["spider"] == "gdp" and record["rejected_at"].endswith("+00:00") for record in records)
+    assert (pipeline.items, pipeline.rejected) == (3, 2)